@@ -0,0 +1,65 @@
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+
+class Overloaded(Exception):
+    """The generation queue is too deep to take this request right now."""
+
+
+class TierPolicy(NamedTuple):
+    priority: int  # lower is served first
+    max_queue: int  # queue depth at which `on_overload` applies
+    on_overload: str = "queue"  # "queue", "downgrade", "cache_only" or "shed"
+    downgrade_tokens: int = 300  # max_new_tokens for downgraded requests
+    shed_queue: Optional[int] = None  # depth at which requests are rejected
+
+
+class Admission(NamedTuple):
+    action: str  # "admit", "downgrade", "cache_only" or "shed"
+    priority: int
+    max_new_tokens: Optional[int] = None
+
+
+class AdmissionController:
+    """
+    Decides, per tier, what to do with a request given the current queue
+    depth: admit it, admit it with a smaller token budget, serve it only
+    from cache, or reject it. Counts each outcome per tier.
+    """
+
+    def __init__(self, policies: Dict[str, TierPolicy], default_tier: str):
+        for policy in policies.values():
+            if policy.on_overload not in ("queue", "downgrade", "cache_only", "shed"):
+                raise ValueError(f"Unknown overload action {policy.on_overload!r}")
+        self.policies = policies
+        self.default_tier = default_tier
+        self.counts: Dict[str, Dict[str, int]] = {
+            tier: {"admit": 0, "downgrade": 0, "cache_only": 0, "shed": 0}
+            for tier in policies
+        }
+        self._lock = threading.Lock()
+
+    def tier(self, tier: Optional[str]) -> str:
+        return tier if tier in self.policies else self.default_tier
+
+    def ahead(self, tier: Optional[str]) -> List[str]:
+        """Tiers served no later than `tier`: only their queue counts against it."""
+        priority = self.policies[self.tier(tier)].priority
+        return [t for t, p in self.policies.items() if p.priority <= priority]
+
+    def admit(self, tier: Optional[str], queue_depth: int) -> Admission:
+        tier = self.tier(tier)
+        policy = self.policies[tier]
+        action = "admit"
+        if policy.shed_queue is not None and queue_depth >= policy.shed_queue:
+            action = "shed"
+        elif queue_depth >= policy.max_queue and policy.on_overload != "queue":
+            action = policy.on_overload
+        with self._lock:
+            self.counts[tier][action] += 1
+        tokens = policy.downgrade_tokens if action == "downgrade" else None
+        return Admission(action, policy.priority, tokens)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {tier: dict(counts) for tier, counts in self.counts.items()}
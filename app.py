@@ -1,11 +1,22 @@
 # === app.py ===
 import streamlit as st
+from typing import List
 from db import get_db_connection
 from auth import register_user, login_user, load_preferences, save_preferences
-from detect import detect_vegetables, candidate_labels
+from detect import clip
+from vocab_index import detect_ingredients, ingredient_index, top_categories
 from components import login_form, preferences_form, ingredient_input
-from PIL import Image
-from recipe_gen import generate_recipe  # accepts recipe_name parameter
+from ingest import IngestedImage, submit_ingest
+from recipe_gen import generate_recipe_stream, generator  # accepts recipe_name
+from cancellation import session_tokens
+from admission import Overloaded
+import metrics
+
+# --- Start loading model weights in the background (no-op on reruns) ---
+clip.warm()
+ingredient_index.warm()
+generator.warm()
+metrics.export_from_env()  # METRICS_PORT / METRICS_FILE, once per process
 
 # --- Streamlit Page Config ---
 st.set_page_config(page_title="IngrEdibles", layout="wide")
@@ -81,6 +92,41 @@ top_bar_html = """
 """
 st.markdown(top_bar_html, unsafe_allow_html=True)
 
+
+# --- Cancel the previous run's generation when this session reruns ---
+def run_cancel_token():
+    """Token for this script run: replaces the session's last one and fires
+    if the browser disconnects."""
+    try:
+        from streamlit.runtime import get_instance
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        runtime, session_id = get_instance(), get_script_run_ctx().session_id
+    except Exception:  # not running under `streamlit run`
+        return None
+    return session_tokens.start(
+        session_id, alive=lambda: runtime.is_active_session(session_id)
+    )
+
+
+cancel = run_cancel_token()
+
+
+def ingest_uploads(uploaded) -> List[IngestedImage]:
+    """
+    Decode each upload once, keyed on its file_id: new uploads are decoded
+    in parallel on the ingest pool, and reruns reuse the results.
+    """
+    decoded = st.session_state.setdefault("ingested", {})
+    ids = [f.file_id for f in uploaded]
+    for f in uploaded:
+        if f.file_id not in decoded:
+            decoded[f.file_id] = submit_ingest(f)
+    for stale in set(decoded) - set(ids):
+        del decoded[stale]  # removed from the uploader
+    return [decoded[i].result() for i in ids]
+
+
 # --- Session Defaults ---
 if "user" not in st.session_state:
     st.session_state.user = None
@@ -100,26 +146,37 @@ with tab1:
         col_img, col_input = st.columns([2, 1])
         with col_input:
             uploaded, manual, top_k = ingredient_input()
+            # decoded once at model resolution; also gives the previews
+            ingested = ingest_uploads(uploaded) if uploaded else []
             # Optional recipe name for paid users
             if st.session_state.subscription == "Paid":
                 recipe_name = st.text_input("Recipe Name (optional)")
             else:
                 recipe_name = None
+            # one-shot: only the next generation skips the recipe cache
+            if st.button("Give me a fresh variant", key="home_fresh"):
+                st.session_state.fresh_next = True
             st.markdown("<div style='height:1rem'></div>", unsafe_allow_html=True)
             if st.button("Generate Plan", key="home_generate"):
                 ingredients = []
-                if uploaded and top_k:
-                    img = Image.open(uploaded).convert("RGB")
-                    ingredients += [
-                        n for n, _ in detect_vegetables(img, candidate_labels, top_k)
-                    ]
+                if ingested and top_k:
+                    imgs = [item.image for item in ingested]
+                    # full ingredient vocabulary, best categories first
+                    for found in detect_ingredients(
+                        imgs, top_k, top_categories=top_categories
+                    ):
+                        ingredients += [n for n, _ in found]
                 if manual:
                     ingredients += [
                         i.strip().lower() for i in manual.split(",") if i.strip()
                     ]
                 st.session_state.detected = list(dict.fromkeys(ingredients))
-            if uploaded:
-                st.image(uploaded, caption="Image Preview", width=200)
+            if ingested:
+                st.image(
+                    [item.preview for item in ingested],
+                    caption=["Image Preview"] * len(ingested),
+                    width=200,
+                )
 
         with col_img:
             if "detected" in st.session_state:
@@ -139,6 +196,7 @@ with tab1:
             st.subheader("Recipe Suggestions")
             ingredients = st.session_state.detected
             ing_list = ", ".join([i.title() for i in ingredients])
+            fresh = st.session_state.pop("fresh_next", False)
             try:
                 if st.session_state.subscription == "Paid":
                     prefs = load_preferences(st.session_state.user_id) or {}
@@ -152,25 +210,43 @@ with tab1:
                     st.markdown(f"**Personalized Settings:** {info}")
                     pref_items = [f"{k}: {v}" for k, v in prefs.items() if v]
                     pref_str = "; ".join(pref_items)
-                    recipe = generate_recipe(
+                    chunks = generate_recipe_stream(
                         ingredients_list=ing_list.lower(),
                         cuisine=prefs.get("cuisine", "any"),
                         difficulty=prefs.get("cook_time", "any"),
                         meal=prefs.get("meal_type", "any"),
                         preferences=pref_str,
                         recipe_name=recipe_name,
+                        fresh=fresh,
+                        tier=st.session_state.subscription,
+                        cancel=cancel,
                     )
-                    st.markdown(recipe, unsafe_allow_html=True)
+                    # render tokens as they arrive
+                    placeholder = st.empty()
+                    recipe = ""
+                    for chunk in chunks:
+                        recipe += chunk
+                        placeholder.markdown(recipe, unsafe_allow_html=True)
                 else:
-                    recipe = generate_recipe(
+                    chunks = generate_recipe_stream(
                         ingredients_list=ing_list.lower(),
                         cuisine="any",
                         difficulty="any",
                         meal="any",
                         preferences="",
                         recipe_name=None,
+                        fresh=fresh,
+                        tier=st.session_state.subscription,
+                        cancel=cancel,
                     )
-                    st.text_area("General Recipe:", recipe, height=400)
+                    placeholder = st.empty()
+                    recipe = ""
+                    for chunk in chunks:
+                        recipe += chunk
+                        placeholder.text(recipe)
+                    placeholder.text_area("General Recipe:", recipe, height=400)
+            except Overloaded as e:
+                st.warning(str(e))
             except Exception as e:
                 st.error(f"Error generating recipe: {e}")
 
@@ -321,7 +397,7 @@ st.markdown(footer_html, unsafe_allow_html=True)
 import streamlit as st
 from PIL import Image
 from typing import List, Tuple
-from detect import candidate_labels
+from vocab_index import max_top_k
 
 # --- Repeat Theme CSS for Sidebar Elements ---
 st.markdown(
@@ -415,5 +491,5 @@ def ingredient_input():
     manual = st.sidebar.text_input("Or Enter the ingredients", "")
     top_k = None
     if uploaded:
-        top_k = st.sidebar.slider("How many to detect?", 1, len(candidate_labels), 5)
+        top_k = st.sidebar.slider("How many to detect?", 1, max_top_k, 5)
     return uploaded, manual, top_k
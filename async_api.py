@@ -0,0 +1,184 @@
+"""
+asyncio counterparts of the detection and generation entry points.
+
+Blocking work runs on one bounded thread pool; per-kind semaphores cap
+how many detections and generations are in flight, so detection for one
+user overlaps generation for another on a single event loop.
+
+    recipe = await generate_recipe_async(..., timeout=120)
+
+A timeout or task cancellation stops the caller from waiting; recipe
+generations are cancelled as well, other calls still run to completion
+on their worker thread.
+"""
+
+import os
+import asyncio
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Callable, List, Optional, Tuple, TypeVar
+from PIL import Image
+import detect
+import recipe_gen
+from cancellation import CancelToken
+
+T = TypeVar("T")
+
+concurrency = {
+    "detect": int(os.getenv("ASYNC_DETECT_CONCURRENCY", "2")),
+    "generate": int(os.getenv("ASYNC_GENERATE_CONCURRENCY", "4")),
+}
+executor = ThreadPoolExecutor(
+    max_workers=sum(concurrency.values()), thread_name_prefix="async-api"
+)
+
+# asyncio primitives belong to one loop, so keep a set per running loop
+_semaphores: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def _semaphore(kind: str) -> asyncio.Semaphore:
+    per_loop = _semaphores.setdefault(asyncio.get_running_loop(), {})
+    if kind not in per_loop:
+        per_loop[kind] = asyncio.Semaphore(concurrency[kind])
+    return per_loop[kind]
+
+
+async def run_blocking(
+    kind: str, fn: Callable[..., T], *args, timeout: Optional[float] = None, **kwargs
+) -> T:
+    """Run `fn` on the shared executor under the `kind` semaphore."""
+    async with _semaphore(kind):
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(executor, partial(fn, *args, **kwargs))
+        return await asyncio.wait_for(future, timeout)
+
+
+async def detect_vegetables_async(
+    image: Image.Image,
+    labels: List[str],
+    top_k: int = 5,
+    threshold: float = 0.01,
+    timeout: Optional[float] = None,
+) -> List[Tuple[str, float]]:
+    return await run_blocking(
+        "detect",
+        detect.detect_vegetables,
+        image,
+        labels,
+        top_k,
+        threshold,
+        timeout=timeout,
+    )
+
+
+async def detect_vegetables_batch_async(
+    images: List[Image.Image],
+    labels: List[str],
+    top_k: int = 5,
+    threshold: float = 0.01,
+    timeout: Optional[float] = None,
+) -> List[List[Tuple[str, float]]]:
+    return await run_blocking(
+        "detect",
+        detect.detect_vegetables_batch,
+        images,
+        labels,
+        top_k,
+        threshold,
+        timeout=timeout,
+    )
+
+
+async def generate_text_async(
+    prompt: str,
+    max_new_tokens: int = 750,
+    temperature: float = 0.7,
+    top_p: float = 0.95,
+    repetition_penalty: float = 1.1,
+    timeout: Optional[float] = None,
+) -> str:
+    return await run_blocking(
+        "generate",
+        recipe_gen.generate_text,
+        prompt,
+        max_new_tokens=max_new_tokens,
+        temperature=temperature,
+        top_p=top_p,
+        repetition_penalty=repetition_penalty,
+        timeout=timeout,
+    )
+
+
+async def generate_recipe_async(
+    ingredients_list: str,
+    cuisine: str,
+    difficulty: str,
+    meal: str,
+    preferences: str,
+    recipe_name: Optional[str],
+    temperature: float = 0.7,
+    fresh: bool = False,
+    tier: Optional[str] = None,
+    timeout: Optional[float] = None,
+) -> str:
+    cancel = CancelToken()
+    try:
+        return await run_blocking(
+            "generate",
+            recipe_gen.generate_recipe,
+            ingredients_list,
+            cuisine,
+            difficulty,
+            meal,
+            preferences,
+            recipe_name,
+            temperature=temperature,
+            fresh=fresh,
+            tier=tier,
+            cancel=cancel,
+            timeout=timeout,
+        )
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        cancel.cancel()
+        raise
+
+
+async def generate_recipe_stream_async(
+    ingredients_list: str,
+    cuisine: str,
+    difficulty: str,
+    meal: str,
+    preferences: str,
+    recipe_name: Optional[str],
+    temperature: float = 0.7,
+    fresh: bool = False,
+    tier: Optional[str] = None,
+    chunk_timeout: Optional[float] = None,
+) -> AsyncIterator[str]:
+    """Async iterator over recipe text chunks; `chunk_timeout` bounds each wait."""
+    cancel = CancelToken()
+    chunks = recipe_gen.generate_recipe_stream(
+        ingredients_list,
+        cuisine,
+        difficulty,
+        meal,
+        preferences,
+        recipe_name,
+        temperature=temperature,
+        fresh=fresh,
+        tier=tier,
+        cancel=cancel,
+    )
+    done = object()
+    async with _semaphore("generate"):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                future = loop.run_in_executor(executor, next, chunks, done)
+                chunk = await asyncio.wait_for(future, chunk_timeout)
+                if chunk is done:
+                    break
+                yield chunk
+        finally:
+            cancel.cancel()  # no-op once generation has finished
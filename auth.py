@@ -1,6 +1,7 @@
 import sqlite3
 import hashlib
 from db import get_db_connection
+from metrics import db_seconds
 import streamlit as st
 
 
@@ -10,6 +11,7 @@ def hash_password(pw: str) -> str:
 
 
 # Registration
+@db_seconds.time(op="register")
 def register_user(username: str, password: str) -> bool:
     conn = get_db_connection()
     c = conn.cursor()
@@ -21,10 +23,12 @@ def register_user(username: str, password: str) -> bool:
         conn.commit()
         return True
     except sqlite3.IntegrityError:
+        conn.rollback()  # else the failed INSERT keeps the write lock until GC
         return False
 
 
 # Login
+@db_seconds.time(op="login")
 def login_user(username: str, password: str):
     conn = get_db_connection()
     c = conn.cursor()
@@ -38,6 +42,7 @@ def login_user(username: str, password: str):
 
 
 # Preferences load/save
+@db_seconds.time(op="load_preferences")
 def load_preferences(user_id: int):
     conn = get_db_connection()
     c = conn.cursor()
@@ -46,7 +51,6 @@ def load_preferences(user_id: int):
         (user_id,),
     )
     row = c.fetchone()
-    print("ROw is :::: ", row)
     if row:
         return {
             "serving": row[0],
@@ -59,6 +63,7 @@ def load_preferences(user_id: int):
     return None
 
 
+@db_seconds.time(op="save_preferences")
 def save_preferences(user_id: int, prefs: dict):
     conn = get_db_connection()
     c = conn.cursor()
@@ -0,0 +1,216 @@
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+from cancellation import CancelToken, GenerationCancelled, cancel_stats
+from metrics import queue_wait_seconds, request_seconds, ttft_seconds
+
+# generate_batch(prompts, temperatures, streamers, cancel_tokens,
+#                max_new_tokens) -> completions
+BatchFn = Callable[
+    [
+        List[str],
+        List[float],
+        List[Optional[Any]],
+        List[Optional[CancelToken]],
+        List[Optional[int]],
+    ],
+    List[Any],
+]
+
+
+class _Request(NamedTuple):
+    prompt: str
+    temperature: float
+    streamer: Optional[Any]
+    cancel: Optional[CancelToken]
+    max_new_tokens: Optional[int]
+    label: str
+    enqueued: float
+    future: Future
+
+
+class _TimedStream:
+    """Records a request's time to first token, then forwards to its streamer."""
+
+    def __init__(self, streamer: Optional[Any], enqueued: float):
+        self.streamer = streamer
+        self.enqueued = enqueued
+        self._first = True
+
+    def put(self, value):
+        if self._first:
+            self._first = False
+            ttft_seconds.observe(time.monotonic() - self.enqueued, path="batched")
+        if self.streamer is not None:
+            self.streamer.put(value)
+
+    def end(self):
+        if self.streamer is not None:
+            self.streamer.end()
+
+
+class GenerationBatcher:
+    """
+    One worker thread owns the model: concurrent callers enqueue prompts
+    and get a Future back. The worker waits up to `max_wait` seconds after
+    the first request for more to arrive, then runs up to `max_batch_size`
+    of them as a single padded generate call. Lower `priority` values are
+    taken first; queue length and queue wait are tracked per `label`.
+    `max_new_tokens` is generate_batch's own cap, counted as avoided work
+    when a request without one is cancelled in the queue.
+    """
+
+    def __init__(
+        self,
+        generate_batch: BatchFn,
+        max_batch_size: int = 4,
+        max_wait: float = 0.05,
+        name: str = "generation-batcher",
+        max_new_tokens: int = 750,
+    ):
+        self.generate_batch = generate_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_new_tokens = max_new_tokens
+        self.name = name
+        self.batches = 0
+        self.requests = 0
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._seq = itertools.count()  # FIFO within a priority
+        self._queued: Dict[str, int] = {}
+        self._waits: Dict[str, List[float]] = {}  # label -> [count, total, max]
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    def submit(
+        self,
+        prompt: str,
+        temperature: float = 0.7,
+        streamer: Optional[Any] = None,
+        cancel: Optional[CancelToken] = None,
+        priority: int = 0,
+        max_new_tokens: Optional[int] = None,
+        label: str = "default",
+    ) -> Future:
+        """
+        Queue a prompt; the future resolves to this row's completion from
+        `generate_batch`. `streamer` (if any) receives this row's tokens.
+        Once `cancel` is cancelled the row stops and the future raises
+        GenerationCancelled. `max_new_tokens` caps this row only.
+        """
+        self._ensure_worker()
+        future: Future = Future()
+        request = _Request(
+            prompt,
+            temperature,
+            streamer,
+            cancel,
+            max_new_tokens,
+            label,
+            time.monotonic(),
+            future,
+        )
+        with self._lock:
+            self._queued[label] = self._queued.get(label, 0) + 1
+        self._queue.put((priority, next(self._seq), request))
+        return future
+
+    def pending(self, label: Optional[str] = None) -> int:
+        if label is None:
+            return self._queue.qsize()
+        with self._lock:
+            return self._queued.get(label, 0)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            queued = dict(self._queued)
+            waits = {
+                label: {"mean_s": total / count, "max_s": longest}
+                for label, (count, total, longest) in self._waits.items()
+            }
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "pending": self.pending(),
+            "queued": queued,
+            "queue_wait": waits,
+        }
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._loop, name=self.name, daemon=True
+                )
+                self._worker.start()
+
+    def _collect(self) -> List[_Request]:
+        batch = [self._queue.get()[-1]]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining)[-1])
+            except queue.Empty:
+                break
+        now = time.monotonic()
+        with self._lock:
+            for r in batch:
+                self._queued[r.label] -= 1
+                wait = self._waits.setdefault(r.label, [0, 0.0, 0.0])
+                wait[0] += 1
+                wait[1] += now - r.enqueued
+                wait[2] = max(wait[2], now - r.enqueued)
+        for r in batch:
+            queue_wait_seconds.observe(now - r.enqueued, tier=r.label)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = []
+            for r in self._collect():
+                if not r.future.set_running_or_notify_cancel():
+                    continue
+                if r.cancel is not None and r.cancel.cancelled:
+                    self._cancelled(r)
+                else:
+                    batch.append(r)
+            if batch:
+                self._run(batch)
+
+    def _cancelled(self, r: _Request):
+        cancel_stats.record(0, r.max_new_tokens or self.max_new_tokens, queued=True)
+        if r.streamer is not None:
+            r.streamer.end()
+        r.future.set_exception(GenerationCancelled("Generation was cancelled"))
+
+    def _run(self, batch: List[_Request]):
+        self.batches += 1
+        self.requests += len(batch)
+        try:
+            outputs = self.generate_batch(
+                [r.prompt for r in batch],
+                [r.temperature for r in batch],
+                [_TimedStream(r.streamer, r.enqueued) for r in batch],
+                [r.cancel for r in batch],
+                [r.max_new_tokens for r in batch],
+            )
+        except BaseException as exc:
+            for r in batch:
+                if r.streamer is not None:
+                    r.streamer.end()  # unblock streaming consumers
+                r.future.set_exception(exc)
+            return
+        for r, text in zip(batch, outputs):
+            if r.cancel is not None and r.cancel.cancelled:
+                # stopped early, so the text is partial
+                r.future.set_exception(GenerationCancelled("Generation was cancelled"))
+            else:
+                r.future.set_result(text)
+                request_seconds.observe(time.monotonic() - r.enqueued, path="batched")
@@ -0,0 +1,16 @@
+"""
+Latency benchmarks for the hot paths: CLIP detection, recipe generation,
+recipe options and the SQLite auth/preferences calls.
+
+    python -m benchmarks --stub                         # offline, tiny random models
+    python -m benchmarks --stub --baseline bench_baseline.json
+    python -m benchmarks --scenarios clip_batch,generate_short --runs 5
+    python -m benchmarks.compare bench_results.json bench_baseline.json
+
+Everything runs inside a scratch directory (`--workdir`, default
+.bench/stub or .bench/real) so the caches and users.db there are
+throwaway. With `--stub` that directory also holds randomly initialized
+models under the real model names, so nothing is downloaded; timings
+then measure the serving code around the models rather than the models
+themselves.
+"""
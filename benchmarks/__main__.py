@@ -0,0 +1,115 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument(
+        "--stub",
+        action="store_true",
+        help="use tiny randomly initialized local models (no network needed)",
+    )
+    parser.add_argument(
+        "--workdir",
+        help="scratch dir for caches and users.db (default: .bench/stub or"
+        " .bench/real; stub models there would shadow the real ones)",
+    )
+    parser.add_argument("--scenarios", help="comma-separated subset (default: all)")
+    parser.add_argument("--runs", type=int, help="timed runs per scenario")
+    parser.add_argument("--warmup", type=int, help="untimed runs per scenario")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.10,
+        help="median slowdown vs the baseline that counts as a regression",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="write these results to --baseline instead of comparing",
+    )
+    parser.add_argument("--list", action="store_true", help="list scenarios and exit")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    # the repo modules create their databases in the working directory
+    if repo_root not in sys.path:
+        sys.path.insert(0, repo_root)
+    workdir = args.workdir or os.path.join(".bench", "stub" if args.stub else "real")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    if args.stub:
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+        import detect
+        import recipe_gen
+        from benchmarks.stub_models import build_stub_models
+
+        draft = recipe_gen.draft_models.get(recipe_gen.primary)
+        llms = [recipe_gen.primary] + ([draft] if draft else [])
+        build_stub_models(llms, detect.model_name)
+
+    import torch
+    import transformers
+    from benchmarks import compare, scenarios
+    from benchmarks.runner import run_scenario
+
+    available = scenarios.build()
+    if args.list:
+        print("\n".join(available))
+        return 0
+    selected = args.scenarios.split(",") if args.scenarios else list(available)
+    unknown = [name for name in selected if name not in available]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "stub": args.stub,
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "transformers": transformers.__version__,
+            "device": "cuda" if torch.cuda.is_available() else "cpu",
+            "cpu_count": os.cpu_count(),
+            "torch_threads": torch.get_num_threads(),
+        },
+        "scenarios": {},
+    }
+    for name in selected:
+        print(f"Running {name}…", file=sys.stderr)
+        stats = run_scenario(available[name], args.runs, args.warmup)
+        results["scenarios"][name] = stats
+        print(
+            f"  p50 {stats['p50_s']:.4f}s  p90 {stats['p90_s']:.4f}s  "
+            f"{stats['units_per_sec']:.1f} {stats['unit']}/s",
+            file=sys.stderr,
+        )
+
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Wrote {output}")
+
+    if baseline_path and args.update_baseline:
+        with open(baseline_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"✅ Updated baseline {baseline_path}")
+    elif baseline_path:
+        rows = compare.compare(results, compare.load(baseline_path), args.tolerance)
+        compare.report(rows)
+        if compare.regressed(rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Compare benchmark results with a stored baseline.
+
+    python -m benchmarks.compare bench_results.json bench_baseline.json --tolerance 0.15
+
+A scenario regresses when its median latency is more than `tolerance`
+(a fraction) above the baseline's. Exits 1 if any scenario regressed.
+"""
+
+import argparse
+import json
+import sys
+from typing import Dict, List
+
+
+def load(path: str) -> Dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(
+    current: Dict, baseline: Dict, tolerance: float = 0.10, metric: str = "p50_s"
+) -> List[Dict]:
+    """One row per scenario in `current`: baseline, current, change, status."""
+    if current["meta"].get("stub") != baseline["meta"].get("stub"):
+        print("⚠️ Comparing stub-model results with real-model results")
+    rows = []
+    for name, result in current["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if base is None:
+            rows.append({"scenario": name, "current": result[metric], "status": "new"})
+            continue
+        change = result[metric] / base[metric] - 1 if base[metric] else 0.0
+        status = "ok"
+        if change > tolerance:
+            status = "regression"
+        elif change < -tolerance:
+            status = "improved"
+        rows.append(
+            {
+                "scenario": name,
+                "baseline": base[metric],
+                "current": result[metric],
+                "change": change,
+                "status": status,
+            }
+        )
+    return rows
+
+
+def report(rows: List[Dict]):
+    print(f"{'scenario':<16} {'baseline':>10} {'current':>10} {'change':>8}  status")
+    for row in rows:
+        base = f"{row['baseline']:.4f}" if "baseline" in row else "-"
+        change = f"{row['change']:+.1%}" if "change" in row else "-"
+        mark = "⚠️ " if row["status"] == "regression" else ""
+        print(
+            f"{row['scenario']:<16} {base:>10} {row['current']:>10.4f} "
+            f"{change:>8}  {mark}{row['status']}"
+        )
+
+
+def regressed(rows: List[Dict]) -> bool:
+    return any(row["status"] == "regression" for row in rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("current")
+    parser.add_argument("baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    rows = compare(load(args.current), load(args.baseline), args.tolerance)
+    report(rows)
+    sys.exit(1 if regressed(rows) else 0)
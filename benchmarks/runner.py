@@ -0,0 +1,59 @@
+import statistics
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+import torch
+
+
+class Scenario(NamedTuple):
+    name: str
+    run: Callable[[], int]  # one timed iteration; returns the units it processed
+    unit: str  # e.g. "images" or "tokens"
+    runs: int
+    warmup: int = 1
+    setup: Optional[Callable[[], None]] = None  # before every iteration, untimed
+
+
+def _sync():
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+
+def percentile(times: List[float], q: float) -> float:
+    """Nearest-rank percentile, so small run counts still give a value."""
+    ordered = sorted(times)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+def summarize(times: List[float], units: int, unit: str) -> Dict[str, float]:
+    total = sum(times)
+    return {
+        "runs": len(times),
+        "mean_s": statistics.mean(times),
+        "p50_s": statistics.median(times),
+        "p90_s": percentile(times, 90),
+        "p99_s": percentile(times, 99),
+        "min_s": min(times),
+        "max_s": max(times),
+        "unit": unit,
+        "units_per_sec": units / total if total else 0.0,
+    }
+
+
+def run_scenario(
+    scenario: Scenario, runs: Optional[int] = None, warmup: Optional[int] = None
+) -> Dict[str, float]:
+    for _ in range(scenario.warmup if warmup is None else warmup):
+        if scenario.setup:
+            scenario.setup()
+        scenario.run()
+
+    times, units = [], 0
+    for _ in range(runs or scenario.runs):
+        if scenario.setup:
+            scenario.setup()
+        _sync()
+        start = time.perf_counter()
+        units += scenario.run()
+        _sync()
+        times.append(time.perf_counter() - start)
+    return summarize(times, units, scenario.unit)
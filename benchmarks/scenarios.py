@@ -0,0 +1,198 @@
+"""
+Benchmark scenarios. Repo modules are imported inside `build()`, after
+the runner has moved into its scratch directory, since recipe_gen and
+auth create their SQLite files in the working directory on import.
+"""
+
+import io
+import os
+from functools import lru_cache
+from typing import Dict, List
+import torch
+from PIL import Image
+from benchmarks.runner import Scenario
+from benchmarks.stub_models import repo_root
+
+SHORT_INGREDIENTS = "tomato, basil"
+LONG_INGREDIENTS = (
+    "tomato, potato, onion, carrot, cucumber, spinach, cabbage, broccoli, "
+    "zucchini, pepper, peas, corn, radish, celery, garlic, ginger, lemon, "
+    "green chilli, rice, lentils, chickpeas, paneer, yoghurt, coriander"
+)
+LONG_PREFERENCES = (
+    "Serves 4; spice level 3/5; health goals: high protein, low sodium, "
+    "low sugar; no nuts; prefers one-pot meals with minimal washing up"
+)
+RAW_PROMPT = "Write a short recipe for watermelon salad using mint and feta cheese."
+
+
+def _images(count: int, size: int = 640) -> List[Image.Image]:
+    """Distinct noise photos, decoded the way uploads are."""
+    from ingest import ingest_image
+
+    images = []
+    for i in range(count):
+        channels = [Image.effect_noise((size, size), 32 + 8 * i) for _ in range(3)]
+        buf = io.BytesIO()
+        Image.merge("RGB", channels).save(buf, "JPEG")
+        images.append(ingest_image(buf).image)
+    return images
+
+
+@lru_cache(maxsize=None)
+def bench_user() -> int:
+    """Id of the benchmark account, registered on first use."""
+    import auth
+
+    auth.register_user("bench", "bench")  # False if it already exists
+    return auth.login_user("bench", "bench")["id"]
+
+
+@lru_cache(maxsize=None)
+def ingredient_index():
+    """The Home tab's vocabulary index, built in the scratch directory."""
+    import vocab_index
+
+    vocab = os.path.join(repo_root, vocab_index.vocab_path)
+    return vocab_index.IngredientIndex.load_or_build(
+        vocab, os.path.basename(vocab_index.index_path)
+    )
+
+
+def build(batch_images: int = 8) -> Dict[str, Scenario]:
+    import detect
+    import recipe_gen
+
+    labels = detect.candidate_labels
+    single = _images(1)
+    batch = _images(batch_images)
+
+    def clip_single() -> int:
+        detect.detect_vegetables(single[0], labels)
+        return 1
+
+    def clip_batch() -> int:
+        detect.detect_vegetables_batch(batch, labels)
+        return len(batch)
+
+    def clip_vocab() -> int:
+        # the production path: full vocabulary, best categories first
+        import vocab_index
+
+        vocab_index.detect_ingredients(
+            batch,
+            top_categories=vocab_index.top_categories,
+            index=ingredient_index(),
+        )
+        return len(batch)
+
+    def vocab_setup():
+        ingredient_index()
+        detect.result_cache.clear()
+
+    def seeded():
+        # same sampled tokens every run, so runs do the same amount of work
+        torch.manual_seed(0)
+
+    def n_tokens(text: str) -> int:
+        tokenizer, _ = recipe_gen.pool.get(tier="Paid")
+        return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    def generate_raw() -> int:
+        tokenizer, model = recipe_gen.pool.get(tier="Paid")
+        inputs = tokenizer(RAW_PROMPT, return_tensors="pt").to(model.device)
+        with torch.inference_mode():
+            out = model.generate(**inputs, max_new_tokens=128, min_new_tokens=128)
+        return out.shape[1] - inputs["input_ids"].shape[1]
+
+    def recipe(ingredients: str, preferences: str) -> int:
+        text = recipe_gen.generate_recipe(
+            ingredients,
+            "Italian",
+            "Easy (10-15 min)",
+            "Dinner",
+            preferences,
+            None,
+            fresh=True,
+            tier="Paid",
+        )
+        return n_tokens(text)
+
+    def recipe_options() -> int:
+        options = recipe_gen.generate_recipe_options(
+            SHORT_INGREDIENTS, "Indian", "Medium (20-30 min)", "Lunch", "", tier="Paid"
+        )
+        return sum(n_tokens(o["full_recipe"]) for o in options)
+
+    def auth_login() -> int:
+        import auth
+
+        auth.login_user("bench", "bench")
+        return 1
+
+    prefs = {
+        "serving": 2,
+        "spice_level": 3,
+        "meal_type": "Dinner",
+        "cuisine": "Italian",
+        "cook_time": "Easy (10-15 min)",
+        "health_goals": ["High protein", "Low sodium"],
+    }
+
+    def preferences() -> int:
+        import auth
+
+        auth.save_preferences(bench_user(), prefs)
+        auth.load_preferences(bench_user())
+        return 2
+
+    scenarios = [
+        Scenario(
+            "clip_single",
+            clip_single,
+            "images",
+            runs=20,
+            warmup=2,
+            setup=detect.result_cache.clear,
+        ),
+        Scenario(
+            "clip_batch",
+            clip_batch,
+            "images",
+            runs=10,
+            warmup=1,
+            setup=detect.result_cache.clear,
+        ),
+        Scenario(
+            "clip_vocab", clip_vocab, "images", runs=10, warmup=1, setup=vocab_setup
+        ),
+        Scenario(
+            "generate_raw", generate_raw, "tokens", runs=5, warmup=1, setup=seeded
+        ),
+        Scenario(
+            "generate_short",
+            lambda: recipe(SHORT_INGREDIENTS, ""),
+            "tokens",
+            runs=3,
+            warmup=1,
+            setup=seeded,
+        ),
+        Scenario(
+            "generate_long",
+            lambda: recipe(LONG_INGREDIENTS, LONG_PREFERENCES),
+            "tokens",
+            runs=3,
+            warmup=1,
+            setup=seeded,
+        ),
+        Scenario(
+            "recipe_options", recipe_options, "tokens", runs=2, warmup=1, setup=seeded
+        ),
+        Scenario(
+            "auth_login", auth_login, "queries", runs=200, warmup=5, setup=bench_user
+        ),
+        Scenario(
+            "preferences", preferences, "queries", runs=200, warmup=5, setup=bench_user
+        ),
+    ]
+    return {s.name: s for s in scenarios}
@@ -0,0 +1,149 @@
+"""
+Tiny randomly initialized stand-ins for the recipe LLM, its draft model
+and CLIP, saved under their Hugging Face names so that from_pretrained
+finds them in the current directory without network access.
+"""
+
+import json
+import os
+import tempfile
+import torch
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _corpus() -> str:
+    """Text the stub LLM tokenizer is trained on: prompt and recipe words."""
+    parts = []
+    for name in ("recipe.txt", "recipe_gen.py", "ingredients.csv"):
+        path = os.path.join(repo_root, name)
+        if os.path.exists(path):
+            with open(path) as f:
+                parts.append(f.read())
+    return "\n".join(parts)
+
+
+def build_llm(path: str, vocab_size: int = 500, seed: int = 0):
+    """Byte-level BPE tokenizer + 2-layer Llama, small enough for any CPU."""
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+    torch.manual_seed(seed)
+    bpe = Tokenizer(models.BPE(unk_token="<unk>"))
+    bpe.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    bpe.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=vocab_size,
+        special_tokens=["<unk>", "<s>", "</s>", "<pad>"],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+    )
+    bpe.train_from_iterator([_corpus()], trainer)
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=bpe,
+        unk_token="<unk>",
+        bos_token="<s>",
+        eos_token="</s>",
+        pad_token="<pad>",
+    )
+    tokenizer.save_pretrained(path)
+
+    config = LlamaConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=64,
+        intermediate_size=128,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=2048,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id,
+    )
+    model = LlamaForCausalLM(config)
+    model.generation_config.do_sample = True
+    model.save_pretrained(path)
+
+
+def _bytes_to_unicode() -> dict:
+    """GPT-2's byte -> printable character table, as CLIPTokenizer expects."""
+    bs = (
+        list(range(ord("!"), ord("~") + 1))
+        + list(range(ord("¡"), ord("¬") + 1))
+        + list(range(ord("®"), ord("ÿ") + 1))
+    )
+    cs = bs[:]
+    n = 0
+    for b in range(2**8):
+        if b not in bs:
+            bs.append(b)
+            cs.append(2**8 + n)
+            n += 1
+    return dict(zip(bs, [chr(c) for c in cs]))
+
+
+def build_clip(path: str, seed: int = 0):
+    """Character-level CLIP tokenizer + 2-layer towers at 224px input."""
+    from transformers import (
+        CLIPConfig,
+        CLIPImageProcessor,
+        CLIPModel,
+        CLIPProcessor,
+        CLIPTokenizer,
+    )
+
+    torch.manual_seed(seed)
+    chars = list(_bytes_to_unicode().values())
+    vocab = {c: i for i, c in enumerate(chars)}
+    vocab.update({c + "</w>": len(chars) + i for i, c in enumerate(chars)})
+    vocab["<|startoftext|>"] = len(vocab)
+    vocab["<|endoftext|>"] = len(vocab)
+    with tempfile.TemporaryDirectory() as tmp:
+        vocab_file = os.path.join(tmp, "vocab.json")
+        merges_file = os.path.join(tmp, "merges.txt")
+        with open(vocab_file, "w") as f:
+            json.dump(vocab, f)
+        with open(merges_file, "w") as f:
+            f.write("#version: 0.2\n")
+        tokenizer = CLIPTokenizer(vocab_file, merges_file)
+        image_processor = CLIPImageProcessor(
+            size={"shortest_edge": 224}, crop_size={"height": 224, "width": 224}
+        )
+        CLIPProcessor(
+            image_processor=image_processor, tokenizer=tokenizer
+        ).save_pretrained(path)
+
+    end = vocab["<|endoftext|>"]
+    config = CLIPConfig(
+        text_config=dict(
+            vocab_size=len(vocab),
+            hidden_size=32,
+            intermediate_size=64,
+            num_hidden_layers=2,
+            num_attention_heads=2,
+            max_position_embeddings=77,
+            bos_token_id=vocab["<|startoftext|>"],
+            eos_token_id=end,
+            pad_token_id=end,
+        ),
+        vision_config=dict(
+            hidden_size=32,
+            intermediate_size=64,
+            num_hidden_layers=2,
+            num_attention_heads=2,
+            image_size=224,
+            patch_size=32,
+        ),
+        projection_dim=16,
+    )
+    CLIPModel(config).save_pretrained(path)
+
+
+def build_stub_models(llm_names, clip_name: str):
+    """Create any stub model missing from the current directory."""
+    for name in llm_names:
+        if not os.path.exists(os.path.join(name, "config.json")):
+            print(f"Building stub LLM {name}")
+            build_llm(name)
+    if not os.path.exists(os.path.join(clip_name, "config.json")):
+        print(f"Building stub CLIP {clip_name}")
+        build_clip(clip_name)
@@ -0,0 +1,164 @@
+"""
+Offline bulk recipe generation from a JSONL file of requests, e.g. to
+pre-generate catalog content or warm the recipe caches overnight.
+
+    python bulk_generate.py catalog_requests.jsonl recipes.jsonl
+    python bulk_generate.py catalog_requests.jsonl recipes.jsonl --concurrency 16
+
+One request per line:
+
+    {"id": "r1", "ingredients": "tomato, onion", "cuisine": "Italian",
+     "cook_time": "Easy (10-15 min)", "meal": "Dinner",
+     "preferences": "", "recipe_name": null}
+
+Requests go through generate_recipe, so results land in the recipe caches
+and concurrent requests are merged into batches by the batching worker.
+They run in the Batch tier by default: behind interactive requests, but
+never downgraded or shed.
+Each result is appended to the output as soon as it is done. Running
+again skips ids that already succeeded and retries the ones that failed.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, Optional, Set, Tuple
+import recipe_gen
+
+
+def read_requests(path: str) -> Iterator[Tuple[str, Dict]]:
+    """(id, record) per non-blank line; records without an id use their line number."""
+    with open(path) as f:
+        for n, line in enumerate(f, start=1):
+            if line.strip():
+                record = json.loads(line)
+                yield str(record.get("id", f"line-{n}")), record
+
+
+def completed_ids(path: str) -> Set[str]:
+    done = set()
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # line cut short by a crash
+                if "recipe" in result:
+                    done.add(result["id"])
+    return done
+
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def generate_one(
+    record: Dict, temperature: float, tier: Optional[str]
+) -> recipe_gen.RecipeResult:
+    ingredients = record["ingredients"]
+    if isinstance(ingredients, list):
+        ingredients = ", ".join(ingredients)
+    return recipe_gen.generate_recipe_result(
+        ingredients,
+        record.get("cuisine", "any"),
+        record.get("cook_time", record.get("difficulty", "any")),
+        record.get("meal", "any"),
+        record.get("preferences", ""),
+        record.get("recipe_name"),
+        temperature=record.get("temperature", temperature),
+        tier=record.get("tier", tier),
+    )
+
+
+def run(
+    src: str,
+    dst: str,
+    concurrency: int,
+    temperature: float = 0.7,
+    tier: Optional[str] = "Batch",
+) -> Dict[str, float]:
+    skip = completed_ids(dst)
+    recipe_gen.pool.get(tier=tier)  # load before the clock starts
+    counts = {"done": 0, "failed": 0, "skipped": 0, "cached": 0, "tokens": 0}
+    start = time.perf_counter()
+
+    with open(dst, "a") as out, ThreadPoolExecutor(concurrency) as executor:
+        if out.tell() and not _ends_with_newline(dst):
+            out.write("\n")  # don't glue onto a line cut short by a crash
+
+        def finish(request_id: str, future):
+            try:
+                recipe = future.result()
+                result = {"id": request_id, "recipe": recipe.text}
+                counts["done"] += 1
+                if recipe.cached:
+                    counts["cached"] += 1  # no tokens generated for it
+                else:
+                    tokenizer, _ = recipe_gen.pool.get(recipe.model_name)
+                    counts["tokens"] += len(tokenizer(recipe.text)["input_ids"])
+            except Exception as exc:
+                result = {"id": request_id, "error": f"{type(exc).__name__}: {exc}"}
+                counts["failed"] += 1
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+
+        # keep enough requests in flight to fill the batcher, but read the
+        # input lazily so large files are never held in memory
+        in_flight = {}
+        for request_id, record in read_requests(src):
+            if request_id in skip:
+                counts["skipped"] += 1
+                continue
+            if len(in_flight) >= concurrency:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    finish(in_flight.pop(future), future)
+                report(counts, time.perf_counter() - start)
+            future = executor.submit(generate_one, record, temperature, tier)
+            in_flight[future] = request_id
+        for future in wait(in_flight).done:
+            finish(in_flight.pop(future), future)
+
+    elapsed = time.perf_counter() - start
+    counts["seconds"] = elapsed
+    counts["requests_per_sec"] = counts["done"] / elapsed if elapsed else 0.0
+    counts["tokens_per_sec"] = counts["tokens"] / elapsed if elapsed else 0.0
+    return counts
+
+
+def report(counts: Dict[str, float], elapsed: float):
+    print(
+        f"{counts['done']} done, {counts['failed']} failed | "
+        f"{counts['done'] / elapsed:.2f} req/s, {counts['tokens'] / elapsed:.1f} tok/s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=2 * int(os.getenv("RECIPE_MAX_BATCH_SIZE", "4")),
+        help="requests in flight (default: two full generation batches)",
+    )
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--tier", default="Batch")
+    args = parser.parse_args()
+
+    stats = run(args.input, args.output, args.concurrency, args.temperature, args.tier)
+    print(f"Completed:   {stats['done']} ({stats['skipped']} already done)")
+    print(f"From cache:  {stats['cached']}")
+    print(f"Failed:      {stats['failed']}")
+    print(f"Elapsed:     {stats['seconds']:.1f}s")
+    print(f"Requests/s:  {stats['requests_per_sec']:.2f}")
+    print(f"Tokens/s:    {stats['tokens_per_sec']:.1f} (generated only)")
+    sys.exit(1 if stats["failed"] else 0)
@@ -0,0 +1,128 @@
+import threading
+from typing import Callable, Dict, List, Optional
+import torch
+
+
+class GenerationCancelled(Exception):
+    """Raised to callers whose request was cancelled before it finished."""
+
+
+class CancelToken:
+    """
+    Set once a request's result is no longer wanted. `alive`, if given,
+    is polled as well (e.g. "is the browser session still connected").
+    """
+
+    def __init__(self, alive: Optional[Callable[[], bool]] = None):
+        self._event = threading.Event()
+        self._alive = alive
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self._alive is not None and not self._alive():
+            self._event.set()
+        return self._event.is_set()
+
+
+class SessionTokens:
+    """
+    One live token per session: starting a new request cancels the last
+    one. Sessions whose `alive` check reports them gone are dropped on the
+    next start, so closed browser tabs leave no entry behind.
+    """
+
+    def __init__(self):
+        self._tokens: Dict[str, CancelToken] = {}
+        self._lock = threading.Lock()
+
+    def start(
+        self, session_id: str, alive: Optional[Callable[[], bool]] = None
+    ) -> CancelToken:
+        token = CancelToken(alive)
+        with self._lock:
+            previous = self._tokens.pop(session_id, None)
+            for gone in [s for s, t in self._tokens.items() if t.cancelled]:
+                del self._tokens[gone]
+            self._tokens[session_id] = token
+        if previous is not None:
+            previous.cancel()
+        return token
+
+    def cancel(self, session_id: str):
+        with self._lock:
+            token = self._tokens.pop(session_id, None)
+        if token is not None:
+            token.cancel()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._tokens)
+
+
+session_tokens = SessionTokens()
+
+
+class CancelStats:
+    """
+    Cancelled generations and the decode work they did and did not use.
+    `queued` counts those cancelled before they left the batcher's queue.
+    """
+
+    def __init__(self):
+        self.cancelled = 0
+        self.queued = 0
+        self.tokens_wasted = 0
+        self.tokens_avoided = 0
+        self._lock = threading.Lock()
+
+    def record(self, generated: int, avoided: int, queued: bool = False):
+        with self._lock:
+            self.cancelled += 1
+            self.queued += queued
+            self.tokens_wasted += generated
+            self.tokens_avoided += avoided
+
+    def report(self) -> Dict[str, int]:
+        return {
+            "cancelled": self.cancelled,
+            "queued": self.queued,
+            "tokens_wasted": self.tokens_wasted,
+            "tokens_avoided": self.tokens_avoided,
+        }
+
+
+cancel_stats = CancelStats()
+
+
+class CancelStopping:
+    """
+    Stopping criterion that ends row i as soon as `tokens[i]` is
+    cancelled; it is checked after every decode step.
+    """
+
+    def __init__(
+        self,
+        tokens: List[Optional[CancelToken]],
+        prompt_len: int,
+        max_new_tokens: int,
+    ):
+        self.tokens = tokens
+        self.prompt_len = prompt_len
+        self.max_new_tokens = max_new_tokens
+        self.stopped_at: List[Optional[int]] = [None] * len(tokens)
+
+    def __call__(self, input_ids: torch.Tensor, scores, **kwargs) -> torch.Tensor:
+        generated = input_ids.shape[1] - self.prompt_len
+        for i, token in enumerate(self.tokens):
+            if self.stopped_at[i] is None and token is not None and token.cancelled:
+                self.stopped_at[i] = generated
+        done = [at is not None for at in self.stopped_at]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+    def finish(self, stats: CancelStats = cancel_stats):
+        for at in self.stopped_at:
+            if at is not None:
+                stats.record(at, self.max_new_tokens - at)
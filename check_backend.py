@@ -0,0 +1,36 @@
+"""
+Accuracy check for the quantized CLIP backends against fp32.
+
+    python check_backend.py int8 images/
+    python check_backend.py onnx images/ --top-k 5 --min-overlap 0.8
+"""
+
+import argparse
+import os
+import sys
+from PIL import Image
+from detect import backend_agreement, candidate_labels
+
+
+def load_fixture_images(folder: str):
+    names = sorted(
+        n for n in os.listdir(folder) if n.lower().endswith((".jpg", ".jpeg", ".png"))
+    )
+    return [Image.open(os.path.join(folder, n)).convert("RGB") for n in names]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("backend", choices=["int8", "onnx"])
+    parser.add_argument("folder", nargs="?", default="images")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--min-overlap", type=float, default=0.8)
+    args = parser.parse_args()
+
+    images = load_fixture_images(args.folder)
+    stats = backend_agreement(images, candidate_labels, args.backend, args.top_k)
+    print(f"Images:        {len(images)}")
+    print(f"Top-1 match:   {stats['top1_match']:.2%}")
+    print(f"Top-{args.top_k} overlap: {stats['topk_overlap']:.2%}")
+    print(f"Max prob diff: {stats['max_abs_diff']:.4f}")
+    sys.exit(0 if stats["topk_overlap"] >= args.min_overlap else 1)
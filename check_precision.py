@@ -0,0 +1,68 @@
+"""
+Quality smoke test for the CPU precision modes of the recipe LLM.
+
+The fp32 model greedily writes a short recipe; the int8/bf16 model is then
+teacher-forced on the same tokens and must pick the same next token most
+of the time.
+
+    python check_precision.py int8
+    python check_precision.py bf16 --tokens 64 --min-agreement 0.85
+"""
+
+import argparse
+import sys
+import time
+import torch
+from recipe_gen import (
+    build_recipe_prompt,
+    load_model_and_tokenizer,
+    loaded_precision,
+    primary,
+)
+
+
+def precision_agreement(precision: str, model_name: str = primary, tokens: int = 64):
+    tokenizer, reference = load_model_and_tokenizer(model_name, precision="fp32")
+    _, candidate = load_model_and_tokenizer(model_name, precision=precision)
+    prompt = build_recipe_prompt(
+        "tomato, onion, garlic", "Italian", "Easy (10-15 min)", "Dinner", "", None
+    )
+    inputs = tokenizer(prompt, return_tensors="pt")
+    prompt_len = inputs["input_ids"].shape[1]
+    with torch.inference_mode():
+        sequence = reference.generate(**inputs, max_new_tokens=tokens, do_sample=False)
+        ref_logits = reference(sequence).logits[0, prompt_len - 1 : -1].float()
+        start = time.perf_counter()
+        cand_logits = candidate(sequence).logits[0, prompt_len - 1 : -1].float()
+        elapsed = time.perf_counter() - start
+    agreement = (ref_logits.argmax(-1) == cand_logits.argmax(-1)).float().mean()
+    kl = torch.nn.functional.kl_div(
+        cand_logits.log_softmax(-1),
+        ref_logits.log_softmax(-1),
+        log_target=True,
+        reduction="batchmean",
+    )
+    return {
+        "precision": loaded_precision[model_name],
+        "tokens": ref_logits.shape[0],
+        "top1_agreement": agreement.item(),
+        "kl": kl.item(),
+        "forward_s": elapsed,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("precision", choices=["int8", "bf16"])
+    parser.add_argument("--model", default=primary)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--min-agreement", type=float, default=0.85)
+    args = parser.parse_args()
+
+    stats = precision_agreement(args.precision, args.model, args.tokens)
+    print(f"Precision:       {stats['precision']}")
+    print(f"Tokens compared: {stats['tokens']}")
+    print(f"Top-1 agreement: {stats['top1_agreement']:.2%}")
+    print(f"KL(fp32 || {args.precision}): {stats['kl']:.4f}")
+    print(f"Forward pass:    {stats['forward_s']:.3f}s")
+    sys.exit(0 if stats["top1_agreement"] >= args.min_agreement else 1)
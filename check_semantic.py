@@ -0,0 +1,108 @@
+"""
+Check RECIPE_SEMANTIC_THRESHOLD with the real CLIP text model: recipe
+names for different dishes must stay below it, or the semantic cache
+would serve one dish for the other.
+
+    python check_semantic.py
+    python check_semantic.py --threshold 0.97
+
+It also checks that ingredient lists differing only in order and
+plurals share a cache scope, and that different ingredients or
+preferences do not.
+"""
+
+import argparse
+import os
+import sys
+from detect import encode_labels, model_name
+from recipe_cache import normalize_inputs
+from semantic_cache import request_scope, request_text
+
+# different dishes whose names share most of their words
+negative_pairs = [
+    ("chicken curry", "chicken soup"),
+    ("chicken tikka masala", "chicken korma"),
+    ("beef stew", "beef stir fry"),
+    ("vegan chili", "beef chili"),
+    ("pork dumplings", "chicken dumplings"),
+    ("grilled salmon", "grilled chicken"),
+    ("spaghetti carbonara", "spaghetti bolognese"),
+    ("fried rice", "rice pudding"),
+    ("tomato soup", "tomato salad"),
+    ("chocolate cake", "chocolate mousse"),
+    ("banana bread", "banana pancakes"),
+    ("pad thai", "pad see ew"),
+]
+# the same dish, worded differently
+positive_pairs = [
+    ("chicken tikka masala", "chicken tikka masala curry"),
+    ("spaghetti bolognese", "bolognese spaghetti"),
+    ("mac and cheese", "macaroni and cheese"),
+    ("bbq ribs", "barbecue ribs"),
+    ("tofu stir fry", "stir-fried tofu"),
+    ("shepherd's pie", "shepherds pie"),
+]
+# requests with the same name that must never share a recipe:
+# (ingredients, preferences) for each side
+scope_pairs = [
+    (("tofu, rice", "vegan"), ("tofu, rice", "high protein, no nuts")),
+    (("chicken, rice, onion", ""), ("pork, rice, onion", "")),
+]
+# ... and ones that must
+same_scope_pairs = [
+    (("tomato, onion, garlic", ""), ("garlic, onions, tomatoes", "")),
+    (("cherry tomatoes, olives, leaves", ""), ("olive, cherry tomato, leaf", "")),
+    (("berries, peaches, asparagus", ""), ("berry, peach, asparagus", "")),
+]
+
+
+def similarities(pairs):
+    """Cosine similarity of each pair, embedded as the semantic cache does."""
+    texts = [
+        request_text(normalize_inputs("", "", "", "", "", name))
+        for pair in pairs
+        for name in pair
+    ]
+    embeds = encode_labels(texts)
+    return (embeds[0::2] * embeds[1::2]).sum(dim=1).tolist()
+
+
+def scopes_differ(a, b) -> bool:
+    scopes = [
+        request_scope(normalize_inputs(ingredients, "any", "any", "any", prefs, "x"))
+        for ingredients, prefs in (a, b)
+    ]
+    return scopes[0] != scopes[1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=float(os.getenv("RECIPE_SEMANTIC_THRESHOLD", "0.98")),
+    )
+    args = parser.parse_args()
+
+    ok = True
+    for a, b in scope_pairs:
+        if not scopes_differ(a, b):
+            print(f"⚠️ {a} and {b} share a cache scope")
+            ok = False
+    for a, b in same_scope_pairs:
+        if scopes_differ(a, b):
+            print(f"⚠️ {a} and {b} do not share a cache scope")
+            ok = False
+
+    print(f"Embedder: {model_name}  threshold: {args.threshold}")
+    for label, pairs in (("different", negative_pairs), ("same", positive_pairs)):
+        print(f"\n{label} dishes:")
+        for (a, b), sim in zip(pairs, similarities(pairs)):
+            match = sim >= args.threshold
+            mark = "⚠️ " if match and label == "different" else ""
+            print(f"  {sim:.4f} {'match' if match else '     '}  {mark}{a} / {b}")
+            if match and label == "different":
+                ok = False
+
+    print("\n✅ No different dishes match" if ok else "\n⚠️ Threshold too low")
+    sys.exit(0 if ok else 1)
@@ -1,7 +1,7 @@
 import streamlit as st
 from PIL import Image
 from typing import List, Tuple
-from detect import candidate_labels
+from vocab_index import max_top_k
 
 
 # Login / Register form
@@ -78,9 +78,11 @@ def preferences_form(prefs: dict, disabled: bool):
 # Ingredient input component
 def ingredient_input():
     st.sidebar.subheader("Ingredients")
-    uploaded = st.sidebar.file_uploader("Upload Image", type=["jpg", "png"])
+    uploaded = st.sidebar.file_uploader(
+        "Upload Images", type=["jpg", "png"], accept_multiple_files=True
+    )
     manual = st.sidebar.text_input("Or Enter the ingredients", "")
     top_k = None
     if uploaded:
-        top_k = st.sidebar.slider("How many to detect?", 1, len(candidate_labels), 5)
+        top_k = st.sidebar.slider("How many to detect?", 1, max_top_k, 5)
     return uploaded, manual, top_k
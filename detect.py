@@ -1,17 +1,58 @@
+import os
+import hashlib
 from PIL import Image
 import torch
-from transformers import CLIPProcessor, CLIPModel
-from typing import List, Tuple
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+from lazy_model import LazyModel, hf
+from image_cache import DetectionCache, dhash
+from metrics import detect_seconds, register_cache
 
+model_name = "openai/clip-vit-base-patch32"
 
-# Load model & processor once
+# Optional on-disk store for label embeddings (e.g. `export CLIP_EMBED_CACHE=.cache`)
+embed_cache_dir: Optional[str] = os.getenv("CLIP_EMBED_CACHE")
+
+# Largest number of images sent through the vision tower in one forward pass
+max_batch_size = int(os.getenv("CLIP_MAX_BATCH_SIZE", "16"))
+
+# Vision encoder backend: "fp32" (eager PyTorch), "int8" (dynamic quantization)
+# or "onnx" (ONNX Runtime; needs `pip install onnx onnxscript onnxruntime`)
+vision_backend = os.getenv("CLIP_BACKEND", "fp32")
+onnx_path = os.getenv("CLIP_ONNX_PATH", "clip_vision.onnx")
+
+# LRU of results keyed by perceptual hash; set CLIP_RESULT_CACHE to a JSON
+# path to keep it across restarts
+result_cache = DetectionCache(
+    max_size=int(os.getenv("CLIP_RESULT_CACHE_SIZE", "512")),
+    path=os.getenv("CLIP_RESULT_CACHE"),
+)
+register_cache("detection", result_cache)
+
+
+# Load model & processor once, on first use
 def load_clip_model():
-    model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-    processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+    CLIPProcessor, CLIPModel = hf("CLIPProcessor", "CLIPModel")
+
+    model = CLIPModel.from_pretrained(model_name)
+    processor = CLIPProcessor.from_pretrained(model_name)
+    model.eval()
     return model, processor
 
 
-model, processor = load_clip_model()
+clip = LazyModel(load_clip_model, name=model_name)
+
+# "Nothing in particular" prompts each label must beat in tiled detection
+# (comma-separated CLIP_BACKGROUND_PROMPTS overrides them)
+background_prompts: List[str] = [
+    p.strip()
+    for p in os.getenv(
+        "CLIP_BACKGROUND_PROMPTS",
+        "a photo of a kitchen counter,a photo of an empty plate,"
+        "a photo of a cutting board,a photo of a table",
+    ).split(",")
+    if p.strip()
+]
 
 # Candidate labels
 candidate_labels: List[str] = [
@@ -38,18 +79,333 @@ candidate_labels: List[str] = [
     # "mushroom",
 ]
 
+# (model name, labels) -> L2-normalized text embeddings, shape (len(labels), dim)
+_label_embeddings: Dict[Tuple[str, Tuple[str, ...]], torch.Tensor] = {}
 
-# Detection function
-def detect_vegetables(
-    image: Image.Image, labels: List[str], top_k: int = 5, threshold: float = 0.01
+
+def _embedding_path(key: Tuple[str, Tuple[str, ...]]) -> Optional[str]:
+    if not embed_cache_dir:
+        return None
+    digest = hashlib.sha1("\n".join((key[0],) + key[1]).encode()).hexdigest()
+    return os.path.join(embed_cache_dir, f"clip_labels_{digest}.pt")
+
+
+def _normalize(embeds: torch.Tensor) -> torch.Tensor:
+    return embeds / embeds.norm(dim=-1, keepdim=True)
+
+
+def encode_labels(labels: List[str], batch_size: int = 256) -> torch.Tensor:
+    """Run the text tower over `labels` in chunks; returns normalized embeddings."""
+    model, processor = clip.get()
+    chunks = []
+    for start in range(0, len(labels), batch_size):
+        text_inputs = processor(
+            text=list(labels[start : start + batch_size]),
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=model.text_model.config.max_position_embeddings,
+        )
+        with torch.inference_mode():
+            pooled = model.text_model(**text_inputs).pooler_output
+            chunks.append(_normalize(model.text_projection(pooled)))
+    return torch.cat(chunks)
+
+
+def text_fits(text: str) -> bool:
+    """Whether `text` fits CLIP's text context, i.e. encode_labels won't truncate it."""
+    model, processor = clip.get()
+    tokens = len(processor.tokenizer(text)["input_ids"])
+    return tokens <= model.text_model.config.max_position_embeddings
+
+
+def get_label_embeddings(labels: List[str]) -> torch.Tensor:
+    """
+    Return normalized CLIP text embeddings for `labels`, running the text
+    tower only the first time a given label list is seen for this model.
+    """
+    key = (model_name, tuple(labels))
+    cached = _label_embeddings.get(key)
+    if cached is not None:
+        return cached
+
+    path = _embedding_path(key)
+    if path and os.path.exists(path):
+        embeds = torch.load(path)
+    else:
+        embeds = encode_labels(labels)
+        if path:
+            os.makedirs(embed_cache_dir, exist_ok=True)
+            torch.save(embeds, path)
+
+    _label_embeddings[key] = embeds
+    return embeds
+
+
+class VisionTower(torch.nn.Module):
+    """CLIP vision model + projection as one module (pixels -> embeddings)."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.vision_model = model.vision_model
+        self.visual_projection = model.visual_projection
+
+    def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        pooled = self.vision_model(pixel_values=pixel_values).pooler_output
+        return self.visual_projection(pooled)
+
+
+def _build_vision_encoder(backend: str) -> Callable[[torch.Tensor], torch.Tensor]:
+    model, processor = clip.get()
+    tower = VisionTower(model).eval()
+    if backend == "fp32":
+        return tower
+    if backend == "int8":
+        import copy
+
+        # Linear layers dominate ViT-B/32 compute; weights int8, activations
+        # quantized on the fly
+        return torch.ao.quantization.quantize_dynamic(
+            copy.deepcopy(tower), {torch.nn.Linear}, dtype=torch.qint8
+        )
+    # "onnx"
+    import onnxruntime as ort
+
+    if not os.path.exists(onnx_path):
+        size = processor.image_processor.crop_size
+        dummy = torch.zeros(1, 3, size["height"], size["width"])
+        torch.onnx.export(
+            tower,
+            (dummy,),
+            onnx_path,
+            input_names=["pixel_values"],
+            output_names=["image_embeds"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+            opset_version=17,
+        )
+    session = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+
+    def run(pixel_values: torch.Tensor) -> torch.Tensor:
+        (out,) = session.run(None, {"pixel_values": pixel_values.numpy()})
+        return torch.from_numpy(out)
+
+    return run
+
+
+_vision_encoders: Dict[str, LazyModel] = {
+    name: LazyModel(partial(_build_vision_encoder, name), name=f"clip-vision-{name}")
+    for name in ("fp32", "int8", "onnx")
+}
+
+
+def encode_images(
+    pixel_values: torch.Tensor, backend: Optional[str] = None
+) -> torch.Tensor:
+    """Run the vision tower and return normalized image embeddings."""
+    backend = backend or vision_backend
+    if backend not in _vision_encoders:
+        raise ValueError(
+            f"Unknown CLIP backend {backend!r} (expected fp32, int8 or onnx)"
+        )
+    encoder = _vision_encoders[backend].get()
+    with torch.inference_mode():
+        return _normalize(encoder(pixel_values))
+
+
+def _label_probs(image_embeds: torch.Tensor, text_embeds: torch.Tensor) -> torch.Tensor:
+    model, _ = clip.get()
+    with torch.inference_mode():
+        logits = model.logit_scale.exp() * image_embeds @ text_embeds.T
+        return logits.softmax(dim=1)
+
+
+def _top_labels(
+    probs: torch.Tensor, labels: List[str], top_k: int, threshold: float
 ) -> List[Tuple[str, float]]:
-    inputs = processor(text=labels, images=image, return_tensors="pt", padding=True)
-    outputs = model(**inputs)
-    probs = outputs.logits_per_image.softmax(dim=1)
-    top_probs, top_idx = probs.topk(top_k, dim=1)
+    top_probs, top_idx = probs.topk(top_k)
     results = []
-    for i, idx in enumerate(top_idx[0]):
-        score = top_probs[0, i].item()
+    for score, idx in zip(top_probs.tolist(), top_idx.tolist()):
         if score >= threshold:
             results.append((labels[idx], score))
     return results
+
+
+def _result_key(
+    image: Image.Image,
+    labels: List[str],
+    top_k: int,
+    threshold: float,
+    mode: str = "single",
+) -> str:
+    labels_digest = hashlib.sha1("\n".join(labels).encode()).hexdigest()[:16]
+    return (
+        f"{model_name}|{vision_backend}|{mode}|{dhash(image):016x}|"
+        f"{labels_digest}|{top_k}|{threshold}"
+    )
+
+
+# Detection function
+@detect_seconds.time(mode="single")
+def detect_vegetables(
+    image: Image.Image, labels: List[str], top_k: int = 5, threshold: float = 0.01
+) -> List[Tuple[str, float]]:
+    key = _result_key(image, labels, top_k, threshold)
+    cached = result_cache.get(key)
+    if cached is not None:
+        return cached
+
+    _, processor = clip.get()
+    text_embeds = get_label_embeddings(labels)
+    pixel_values = processor(images=image, return_tensors="pt")["pixel_values"]
+    probs = _label_probs(encode_images(pixel_values), text_embeds)
+    results = _top_labels(probs[0], labels, top_k, threshold)
+    result_cache.put(key, results)
+    return results
+
+
+@detect_seconds.time(mode="batch")
+def detect_vegetables_batch(
+    images: List[Image.Image],
+    labels: List[str],
+    top_k: int = 5,
+    threshold: float = 0.01,
+    batch_size: Optional[int] = None,
+) -> List[List[Tuple[str, float]]]:
+    """
+    Detect on many images at once, stacking up to `batch_size` (default
+    `max_batch_size`) images per vision-tower forward pass. Returns one
+    `(label, score)` list per input image, in input order. Images already
+    in `result_cache` are skipped.
+    """
+    keys = [_result_key(img, labels, top_k, threshold) for img in images]
+    results: List[Optional[List[Tuple[str, float]]]] = [
+        result_cache.get(key) for key in keys
+    ]
+    # cache key -> input positions, so duplicates in one upload run once
+    pending: Dict[str, List[int]] = {}
+    for i, found in enumerate(results):
+        if found is None:
+            pending.setdefault(keys[i], []).append(i)
+    if not pending:
+        return results
+
+    _, processor = clip.get()
+    text_embeds = get_label_embeddings(labels)
+    step = batch_size or max_batch_size
+    todo = list(pending.items())
+    for start in range(0, len(todo), step):
+        chunk = todo[start : start + step]
+        pixel_values = processor(
+            images=[images[positions[0]] for _, positions in chunk],
+            return_tensors="pt",
+        )["pixel_values"]
+        probs = _label_probs(encode_images(pixel_values), text_embeds)
+        for (key, positions), row in zip(chunk, probs):
+            found = _top_labels(row, labels, top_k, threshold)
+            result_cache.put(key, found)
+            for i in positions:
+                results[i] = list(found)
+    return results
+
+
+def _tile_boxes(
+    width: int, height: int, grid: int, overlap: float
+) -> List[Tuple[int, int, int, int]]:
+    """`grid` x `grid` overlapping crop boxes covering the whole image."""
+    tile_w = width / (grid - (grid - 1) * overlap)
+    tile_h = height / (grid - (grid - 1) * overlap)
+    step_w, step_h = tile_w * (1 - overlap), tile_h * (1 - overlap)
+    return [
+        (
+            round(col * step_w),
+            round(row * step_h),
+            round(col * step_w + tile_w),
+            round(row * step_h + tile_h),
+        )
+        for row in range(grid)
+        for col in range(grid)
+    ]
+
+
+@detect_seconds.time(mode="tiled")
+def detect_vegetables_tiled(
+    image: Image.Image,
+    labels: List[str],
+    top_k: int = 5,
+    threshold: float = 0.5,
+    grid: int = 3,
+    overlap: float = 0.25,
+    reduce: str = "max",
+) -> List[Tuple[str, float]]:
+    """
+    Multi-label detection for crowded photos. The full image plus a
+    `grid` x `grid` set of overlapping crops go through the vision tower
+    in batched forward passes. Each crop scores every label independently
+    as a two-way softmax of that label against `background_prompts`: the
+    probability that the crop shows the label rather than an empty
+    kitchen scene, so labels don't compete with each other and 0.5 means
+    "the label matches better than all background prompts together".
+    Crop scores are merged per label by `reduce` ("max" or "mean") and
+    kept if >= `threshold`.
+    """
+    if reduce not in ("max", "mean"):
+        raise ValueError(f"reduce must be 'max' or 'mean', got {reduce!r}")
+    key = _result_key(
+        image,
+        labels,
+        top_k,
+        threshold,
+        mode=f"tiled{grid}x{overlap}{reduce}|{'|'.join(background_prompts)}",
+    )
+    cached = result_cache.get(key)
+    if cached is not None:
+        return cached
+
+    model, processor = clip.get()
+    text_embeds = get_label_embeddings(labels)
+    background_embeds = get_label_embeddings(background_prompts)
+    crops = [image] + [
+        image.crop(box) for box in _tile_boxes(*image.size, grid, overlap)
+    ]
+    image_embeds = []
+    for start in range(0, len(crops), max_batch_size):
+        pixel_values = processor(
+            images=crops[start : start + max_batch_size], return_tensors="pt"
+        )["pixel_values"]
+        image_embeds.append(encode_images(pixel_values))
+    with torch.inference_mode():
+        image_embeds = torch.cat(image_embeds)
+        scale = model.logit_scale.exp()
+        logits = scale * image_embeds @ text_embeds.T
+        background = scale * image_embeds @ background_embeds.T
+        # softmax over [label, *backgrounds], keeping the label's share
+        scores = torch.sigmoid(logits - background.logsumexp(dim=1, keepdim=True))
+        merged = scores.max(dim=0).values if reduce == "max" else scores.mean(dim=0)
+    results = _top_labels(merged, labels, min(top_k, len(labels)), threshold)
+    result_cache.put(key, results)
+    return results
+
+
+def backend_agreement(
+    images: List[Image.Image],
+    labels: List[str],
+    backend: str,
+    top_k: int = 5,
+) -> Dict[str, float]:
+    """
+    Compare `backend` against the fp32 reference on a fixture image set.
+    Returns the top-1 match rate, mean top-k overlap and max |prob diff|.
+    """
+    _, processor = clip.get()
+    text_embeds = get_label_embeddings(labels)
+    pixel_values = processor(images=images, return_tensors="pt")["pixel_values"]
+    ref = _label_probs(encode_images(pixel_values, "fp32"), text_embeds)
+    probs = _label_probs(encode_images(pixel_values, backend), text_embeds)
+    ref_top = ref.topk(top_k, dim=1).indices.tolist()
+    top = probs.topk(top_k, dim=1).indices.tolist()
+    return {
+        "top1_match": sum(a[0] == b[0] for a, b in zip(ref_top, top)) / len(images),
+        "topk_overlap": sum(len(set(a) & set(b)) for a, b in zip(ref_top, top))
+        / (top_k * len(images)),
+        "max_abs_diff": (ref - probs).abs().max().item(),
+    }
@@ -0,0 +1,86 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+from PIL import Image
+from typing import Dict, List, Optional, Tuple
+
+Detection = List[Tuple[str, float]]
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """
+    Difference hash: a 64-bit fingerprint that survives re-encoding,
+    resizing and small colour changes, so re-uploads of a photo collide.
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    px = list(small.getdata())
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = px[row * (hash_size + 1) + col]
+            right = px[row * (hash_size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+class DetectionCache:
+    """
+    Bounded LRU of detection results with hit/miss counters. When `path`
+    is set the cache is loaded from and written back to a JSON file.
+    """
+
+    def __init__(self, max_size: int = 512, path: Optional[str] = None):
+        self.max_size = max_size
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Detection]" = OrderedDict()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load()
+
+    def get(self, key: str) -> Optional[Detection]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(self._entries[key])
+            self.misses += 1
+            return None
+
+    def put(self, key: str, result: Detection):
+        with self._lock:
+            self._entries[key] = list(result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            if self.path:
+                self._save()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def _load(self):
+        with open(self.path) as f:
+            for key, result in json.load(f):
+                self._entries[key] = [(label, score) for label, score in result]
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _save(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(list(self._entries.items()), f)
+        os.replace(tmp, self.path)
@@ -0,0 +1,56 @@
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, List, NamedTuple, Union
+from PIL import Image
+from metrics import image_decode_seconds
+
+# Shortest edge CLIPProcessor resizes to; decoding beyond this is wasted work
+model_size = 224
+preview_size = 200
+
+# PIL releases the GIL while decoding, so a small pool overlaps big uploads
+ingest_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("INGEST_WORKERS", "4")), thread_name_prefix="ingest"
+)
+
+
+class IngestedImage(NamedTuple):
+    image: Image.Image  # RGB, shortest edge ~model_size, ready for detection
+    preview: Image.Image  # small thumbnail for st.image
+
+
+def ingest_image(
+    source: Union[str, BinaryIO], size: int = model_size, thumb: int = preview_size
+) -> IngestedImage:
+    """
+    Decode an upload once at (close to) model resolution. JPEGs use draft
+    mode so libjpeg decodes at 1/2, 1/4 or 1/8 scale directly instead of
+    materializing the full 12MP frame; the preview comes from the same
+    decode.
+    """
+    if hasattr(source, "seek"):
+        source.seek(0)  # Streamlit hands back the same buffer on reruns
+    with image_decode_seconds.time():
+        img = Image.open(source)
+        # draft() keeps both sides >= the requested size, so no quality is lost
+        img.draft("RGB", (size, size))
+        img = img.convert("RGB")
+
+        scale = size / min(img.size)
+        if scale < 1:
+            new_size = (round(img.width * scale), round(img.height * scale))
+            img = img.resize(new_size, Image.BICUBIC, reducing_gap=2.0)
+
+        preview = img.copy()
+        preview.thumbnail((thumb, thumb))
+    return IngestedImage(img, preview)
+
+
+def submit_ingest(source: Union[str, BinaryIO], **kwargs) -> "Future[IngestedImage]":
+    return ingest_pool.submit(ingest_image, source, **kwargs)
+
+
+def ingest_images(sources: List[Union[str, BinaryIO]], **kwargs) -> List[IngestedImage]:
+    """Decode several uploads in parallel on the ingest pool."""
+    futures = [submit_ingest(src, **kwargs) for src in sources]
+    return [f.result() for f in futures]
@@ -0,0 +1,75 @@
+import threading
+from typing import Any, Callable, Dict, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+# transformers resolves its names lazily and that first import is not
+# thread-safe; code that may run while another model warms up imports
+# from transformers under this lock, via hf()
+import_lock = threading.Lock()
+_hf_names: Dict[str, Any] = {}
+
+
+def hf(*names: str) -> Any:
+    """
+    transformers attributes by name, e.g. `hf("AutoTokenizer")` or
+    `Streamer, Stop = hf("TextIteratorStreamer", "StoppingCriteriaList")`.
+    Each name is imported once under `import_lock`; later calls are a
+    dict lookup, so this is cheap on per-request paths.
+    """
+    missing = [n for n in names if n not in _hf_names]
+    if missing:
+        with import_lock:
+            import transformers
+
+            for n in missing:
+                _hf_names[n] = getattr(transformers, n)
+    values = [_hf_names[n] for n in names]
+    return values[0] if len(values) == 1 else values
+
+
+class LazyModel(Generic[T]):
+    """
+    Thread-safe handle that runs `loader` on first use and keeps the result.
+    Call `warm()` at server start to load in a background thread instead.
+    """
+
+    def __init__(self, loader: Callable[[], T], name: str = "model"):
+        self.name = name
+        self._loader = loader
+        self._value: Optional[T] = None
+        self._lock = threading.Lock()
+        self._warm_thread: Optional[threading.Thread] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._value is not None
+
+    def get(self) -> T:
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    self._value = self._loader()
+        return self._value
+
+    def warm(self) -> threading.Thread:
+        """Start loading in a daemon thread (once); returns that thread."""
+        with self._lock:
+            if self._warm_thread is None:
+                self._warm_thread = threading.Thread(
+                    target=self._warm, name=f"warm-{self.name}", daemon=True
+                )
+                self._warm_thread.start()
+            return self._warm_thread
+
+    def _warm(self):
+        try:
+            self.get()
+        except Exception as exc:
+            # get() will retry and raise on the request path
+            print(f"⚠️ Background load of {self.name} failed ({exc})")
+
+    def unload(self):
+        with self._lock:
+            self._value = None
+            self._warm_thread = None
@@ -0,0 +1,238 @@
+"""
+Hot-path latency and throughput metrics in the Prometheus text format.
+
+    METRICS_PORT=9100   serve them at http://localhost:9100/metrics
+    METRICS_FILE=/var/lib/node_exporter/ingredibles.prom
+                        rewrite this file every METRICS_FILE_INTERVAL seconds
+                        (for node_exporter's textfile collector)
+
+Call `export_from_env()` once at startup to enable either.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# seconds, from a fast cache hit up to a long CPU generation
+time_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets=time_buckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # labels -> (bucket counts, sum)
+        self._series: Dict[Labels, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._series.setdefault(
+                key, ([0] * len(self.buckets), [0.0])
+            )
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Time a block, or a whole function when used as a decorator."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(k, list(c), t[0]) for k, (c, t) in self._series.items()]
+        for labels, counts, total in series:
+            for bound, count in zip(self.buckets, counts):
+                le = labels + (("le", _format_value(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(le)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {counts[-1]}")
+        return lines
+
+
+class Collector:
+    """Counter or gauge read at scrape time from existing stats."""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        kind: str,
+        read: Callable[[], Dict[Labels, float]],
+    ):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.read = read
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.read().items():
+            lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+
+_registry: List = []
+
+
+def histogram(name: str, help: str, buckets=time_buckets) -> Histogram:
+    metric = Histogram(name, help, buckets)
+    _registry.append(metric)
+    return metric
+
+
+def collect(
+    name: str, help: str, kind: str, read: Callable[[], Dict[Labels, float]]
+) -> Collector:
+    metric = Collector(name, help, kind, read)
+    _registry.append(metric)
+    return metric
+
+
+_caches: Dict[str, object] = {}
+
+
+def register_cache(name: str, cache):
+    """Export `cache.hits` / `cache.misses` as cache_requests_total{cache=name}."""
+    _caches[name] = cache
+
+
+def _cache_requests() -> Dict[Labels, float]:
+    samples = {}
+    for name, cache in list(_caches.items()):
+        samples[(("cache", name), ("result", "hit"))] = cache.hits
+        samples[(("cache", name), ("result", "miss"))] = cache.misses
+    return samples
+
+
+# ——— Hot-path metrics ———
+cache_requests = collect(
+    "cache_requests_total",
+    "Cache lookups by cache and result",
+    "counter",
+    _cache_requests,
+)
+
+image_decode_seconds = histogram(
+    "image_decode_seconds", "Decoding and downscaling one uploaded image"
+)
+detect_seconds = histogram("clip_detect_seconds", "CLIP detection call, by mode")
+db_seconds = histogram("db_seconds", "Users/preferences SQLite call, by op")
+queue_wait_seconds = histogram(
+    "recipe_queue_wait_seconds", "Time a generation request waited, by tier"
+)
+# path: "batched" (recipes, through GenerationBatcher; timed from enqueue)
+# or "stream" (generate_text_stream; timed from the call)
+ttft_seconds = histogram(
+    "recipe_ttft_seconds", "Request submitted to its first generated token, by path"
+)
+request_seconds = histogram(
+    "recipe_request_seconds", "Request submitted to its complete result, by path"
+)
+prefill_seconds = histogram(
+    "recipe_prefill_seconds", "generate() start to its first decode step"
+)
+generation_seconds = histogram("recipe_generation_seconds", "One generate() call")
+prompt_tokens = histogram(
+    "recipe_prompt_tokens",
+    "Prompt length in tokens, per row",
+    buckets=(32, 64, 128, 256, 384, 512, 768, 1024, 2048),
+)
+decode_tokens_per_second = histogram(
+    "recipe_decode_tokens_per_second",
+    "Generated tokens per second of decoding, per row",
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 200, 500),
+)
+
+
+def render() -> str:
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+
+def write(path: str):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(render())
+    os.replace(tmp, path)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # no access log per scrape
+
+
+def serve(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+def _write_every(path: str, interval: float):
+    while True:
+        try:
+            write(path)
+        except OSError as exc:
+            print(f"⚠️ Could not write metrics to {path} ({exc})")
+        time.sleep(interval)
+
+
+_exporting = False
+_export_lock = threading.Lock()
+
+
+def export_from_env():
+    """Start the endpoint / file writer configured by env vars (once)."""
+    global _exporting
+    with _export_lock:
+        if _exporting:
+            return
+        _exporting = True
+    port: Optional[str] = os.getenv("METRICS_PORT")
+    if port:
+        serve(int(port))
+        print(f"Serving metrics on http://127.0.0.1:{port}/metrics")
+    path = os.getenv("METRICS_FILE")
+    if path:
+        interval = float(os.getenv("METRICS_FILE_INTERVAL", "15"))
+        threading.Thread(
+            target=_write_every, args=(path, interval), name="metrics-file", daemon=True
+        ).start()
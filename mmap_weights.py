@@ -0,0 +1,155 @@
+"""
+Load a causal LM whose weights are memory-mapped straight from its
+safetensors files. Every process that maps the same files shares the
+same page-cache pages, so N worker processes cost one copy of the
+weights instead of N.
+
+Tensors are used in the dtype they are stored in: any conversion
+(bf16 -> fp32, int8 quantization) would copy them into private memory.
+"""
+
+import os
+import json
+import struct
+import contextlib
+import importlib
+from typing import Dict, List, Optional
+import torch
+from lazy_model import hf
+
+_dtypes = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def resolve_model_dir(model_name: str, token: Optional[str] = None) -> str:
+    """Local directory holding the model's config and safetensors files."""
+    if os.path.isdir(model_name):
+        return model_name
+    from huggingface_hub import snapshot_download
+
+    return snapshot_download(
+        model_name, allow_patterns=["*.json", "*.safetensors"], token=token
+    )
+
+
+def safetensors_files(model_dir: str) -> List[str]:
+    index = os.path.join(model_dir, "model.safetensors.index.json")
+    if os.path.exists(index):
+        with open(index) as f:
+            shards = sorted(set(json.load(f)["weight_map"].values()))
+        return [os.path.join(model_dir, shard) for shard in shards]
+    single = os.path.join(model_dir, "model.safetensors")
+    if not os.path.exists(single):
+        raise FileNotFoundError(f"No safetensors weights in {model_dir}")
+    return [single]
+
+
+def weights_bytes(model_name: str, token: Optional[str] = None) -> Optional[int]:
+    """
+    Size of a model's safetensors weights, without loading or downloading
+    them: from the local files if they are there, else from the tensor
+    headers on the Hub. None if neither is available.
+    """
+    from huggingface_hub import get_safetensors_metadata, snapshot_download
+
+    try:
+        model_dir = model_name
+        if not os.path.isdir(model_name):
+            model_dir = snapshot_download(
+                model_name,
+                allow_patterns=["*.json", "*.safetensors"],
+                token=token,
+                local_files_only=True,
+            )
+        return sum(os.path.getsize(path) for path in safetensors_files(model_dir))
+    except Exception:
+        pass
+    try:
+        counts = get_safetensors_metadata(model_name, token=token).parameter_count
+    except Exception:
+        return None
+    if any(dtype not in _dtypes for dtype in counts):
+        return None
+    return sum(
+        count * torch.empty(0, dtype=_dtypes[dtype]).element_size()
+        for dtype, count in counts.items()
+    )
+
+
+def mmap_safetensors(path: str) -> Dict[str, torch.Tensor]:
+    """Tensors of one safetensors file, as views into a private file mapping."""
+    with open(path, "rb") as f:
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len))
+    header.pop("__metadata__", None)
+    # copy-on-write mapping: pages stay shared unless a tensor is written to
+    storage = torch.UntypedStorage.from_file(
+        path, shared=False, nbytes=os.path.getsize(path)
+    )
+    base = 8 + header_len
+    tensors = {}
+    for name, info in header.items():
+        dtype = _dtypes[info["dtype"]]
+        start, end = info["data_offsets"]
+        itemsize = torch.empty(0, dtype=dtype).element_size()
+        offset = base + start
+        if offset % itemsize:
+            # misaligned for a typed view; this one tensor gets its own copy
+            raw = torch.empty(0, dtype=torch.uint8).set_(
+                storage, offset, (end - start,)
+            )
+            tensors[name] = raw.clone().view(dtype).reshape(info["shape"])
+            continue
+        tensors[name] = torch.empty(0, dtype=dtype).set_(
+            storage, offset // itemsize, info["shape"]
+        )
+    return tensors
+
+
+def _skip_init():
+    # no_init_weights moved between transformers releases
+    for module in ("transformers.initialization", "transformers.modeling_utils"):
+        try:
+            return importlib.import_module(module).no_init_weights()
+        except (ImportError, AttributeError):
+            continue
+    return contextlib.nullcontext()
+
+
+def load_mmap_model(model_name: str, token: Optional[str] = None):
+    AutoConfig, AutoModelForCausalLM = hf("AutoConfig", "AutoModelForCausalLM")
+
+    model_dir = resolve_model_dir(model_name, token)
+    state: Dict[str, torch.Tensor] = {}
+    for path in safetensors_files(model_dir):
+        state.update(mmap_safetensors(path))
+    dtype = next(t.dtype for t in state.values() if t.is_floating_point())
+
+    config = AutoConfig.from_pretrained(model_dir)
+    # weights are left uninitialized (untouched pages cost no memory) and
+    # then swapped for the mapped tensors
+    with _skip_init():
+        model = AutoModelForCausalLM.from_config(config, torch_dtype=dtype)
+    missing, _ = model.load_state_dict(state, strict=False, assign=True)
+    model.tie_weights()
+    # keys missing from the checkpoint must now be tied to a mapped tensor
+    mapped = {t.data_ptr() for t in state.values()}
+    tensors = dict(model.named_parameters(remove_duplicate=False))
+    tensors.update(model.named_buffers(remove_duplicate=False))
+    unset = [
+        n for n in missing if n not in tensors or tensors[n].data_ptr() not in mapped
+    ]
+    if unset:
+        raise ValueError(f"{model_name} checkpoint is missing weights: {unset[:5]}")
+    model.name_or_path = model_name
+    return model
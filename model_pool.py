@@ -0,0 +1,221 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import torch
+
+# loader(model_name) -> (tokenizer, model)
+Loader = Callable[[str], Tuple[Any, Any]]
+# estimate(model_name) -> bytes the model will take once loaded, if known
+Estimate = Callable[[str], Optional[int]]
+
+
+def model_bytes(model: torch.nn.Module) -> int:
+    """Bytes held by a model's weights and buffers, tied tensors counted once."""
+    seen = set()
+    total = 0
+
+    def add(value):
+        nonlocal total
+        if isinstance(value, (tuple, list)):
+            for v in value:
+                add(v)
+        elif isinstance(value, torch.Tensor) and value.data_ptr() not in seen:
+            # int8 dynamic-quantized Linears keep their weights in packed
+            # params, which only show up in state_dict()
+            seen.add(value.data_ptr())
+            total += value.numel() * value.element_size()
+
+    for value in model.state_dict(keep_vars=True).values():
+        add(value)
+    return total
+
+
+class ModelPool:
+    """
+    Generator models loaded on demand and kept resident, most recently used
+    first, within `memory_budget` bytes (None: no limit). A model that
+    fails to load is replaced by its registered fallback from then on.
+    Requests are routed by model name or by tier (e.g. "Paid").
+
+    Models are evicted before a load to make room for the incoming one,
+    sized by its earlier load or by `estimate`, and again after it if its
+    real size turns out larger. Evicting a model only drops the pool's
+    reference: generate calls that already hold it finish normally, and
+    the memory is freed after them.
+    """
+
+    def __init__(
+        self,
+        loader: Loader,
+        default: str,
+        memory_budget: Optional[int] = None,
+        estimate: Optional[Estimate] = None,
+    ):
+        self.loader = loader
+        self.default = default
+        self.memory_budget = memory_budget
+        self.estimate = estimate
+        self.loads = 0
+        self.evictions = 0
+        self.load_seconds: Dict[str, float] = {}
+        self._fallbacks: Dict[str, Optional[str]] = {}
+        self._tiers: Dict[str, str] = {}
+        self._redirects: Dict[str, str] = {}
+        self._resident: "OrderedDict[str, Tuple[Any, Any, int]]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}  # measured at load, kept after eviction
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._warm_threads: Dict[str, threading.Thread] = {}
+
+    def register(
+        self, name: str, fallback: Optional[str] = None, tiers: Tuple[str, ...] = ()
+    ):
+        """
+        Add `name` (again): a repeat registration adds its tiers and only
+        replaces the fallback when it passes one.
+        """
+        with self._lock:
+            if fallback is not None or name not in self._fallbacks:
+                self._fallbacks[name] = fallback
+            self._load_locks.setdefault(name, threading.Lock())
+            for tier in tiers:
+                self._tiers[tier] = name
+
+    def route(self, name: Optional[str] = None, tier: Optional[str] = None) -> str:
+        """Registered model for an explicit name, else the tier's, else the default."""
+        name = name or self._tiers.get(tier, self.default)
+        if name not in self._fallbacks:
+            raise KeyError(f"Model {name!r} is not registered in the pool")
+        while name in self._redirects:
+            name = self._redirects[name]
+        return name
+
+    def get(
+        self, name: Optional[str] = None, tier: Optional[str] = None
+    ) -> Tuple[Any, Any]:
+        """(tokenizer, model) for the routed model, loading it if needed."""
+        name = self.route(name, tier)
+        with self._lock:
+            if name in self._resident:
+                self._resident.move_to_end(name)
+                tokenizer, model, _ = self._resident[name]
+                return tokenizer, model
+        with self._load_locks[name]:
+            with self._lock:
+                if name in self._resident:  # loaded while we waited
+                    tokenizer, model, _ = self._resident[name]
+                    return tokenizer, model
+            return self._load(name)
+
+    def _load(self, name: str) -> Tuple[Any, Any]:
+        self._make_room(name)
+        start = time.perf_counter()
+        try:
+            tokenizer, model = self.loader(name)
+        except Exception as exc:
+            fallback = self._fallbacks.get(name)
+            if not fallback:
+                raise
+            print(f"⚠️ Could not load model {name} ({exc}); falling back to {fallback}")
+            with self._lock:
+                self._redirects[name] = fallback
+            return self.get(fallback)
+        elapsed = time.perf_counter() - start
+        size = model_bytes(model)
+        with self._lock:
+            self.loads += 1
+            self.load_seconds[name] = elapsed
+            self._resident[name] = (tokenizer, model, size)
+            self._sizes[name] = size
+            self._evict_over_budget(keep=name)
+        print(f"Loaded {name} in {elapsed:.1f}s ({size / 2**30:.2f} GiB)")
+        return tokenizer, model
+
+    def _make_room(self, name: str):
+        """Evict before loading `name` so that its weights fit in the budget."""
+        if self.memory_budget is None:
+            return
+        size = self._sizes.get(name)
+        if size is None and self.estimate is not None:
+            try:
+                size = self.estimate(name)
+            except Exception as exc:
+                print(f"⚠️ Could not estimate the size of {name} ({exc})")
+        if size:
+            with self._lock:
+                self._evict_over_budget(incoming=size)
+
+    def _evict_over_budget(self, keep: Optional[str] = None, incoming: int = 0):
+        if self.memory_budget is None:
+            return
+        for name in list(self._resident):
+            if self._used() + incoming <= self.memory_budget:
+                break
+            if name != keep:
+                del self._resident[name]
+                self._warm_threads.pop(name, None)
+                self.evictions += 1
+                print(f"Evicted {name} from the model pool (over memory budget)")
+
+    def _used(self) -> int:
+        return sum(size for _, _, size in self._resident.values())
+
+    def evict(self, name: str):
+        with self._lock:
+            self._warm_threads.pop(name, None)
+            if self._resident.pop(name, None) is not None:
+                self.evictions += 1
+
+    def warm(self, name: Optional[str] = None) -> threading.Thread:
+        """Load a model in a daemon thread (once per residency); returns that thread."""
+        name = self.route(name)
+
+        def run():
+            try:
+                self.get(name)
+            except Exception as exc:
+                # get() will retry and raise on the request path
+                print(f"⚠️ Background load of {name} failed ({exc})")
+
+        with self._lock:
+            if name not in self._warm_threads:
+                thread = threading.Thread(target=run, name=f"warm-{name}", daemon=True)
+                self._warm_threads[name] = thread
+                thread.start()
+            return self._warm_threads[name]
+
+    def resident(self) -> List[str]:
+        """Resident models, least recently used first."""
+        with self._lock:
+            return list(self._resident)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "resident": list(self._resident),
+                "memory_bytes": self._used(),
+                "memory_budget": self.memory_budget,
+                "load_seconds": dict(self.load_seconds),
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "redirects": dict(self._redirects),
+            }
+
+
+class ModelHandle:
+    """LazyModel-style view of one pool entry (`get()`, `warm()`, `loaded`)."""
+
+    def __init__(self, pool: ModelPool, name: Optional[str] = None):
+        self.pool = pool
+        self.name = name or pool.default
+
+    @property
+    def loaded(self) -> bool:
+        return self.pool.route(self.name) in self.pool.resident()
+
+    def get(self) -> Tuple[Any, Any]:
+        return self.pool.get(self.name)
+
+    def warm(self) -> threading.Thread:
+        return self.pool.warm(self.name)
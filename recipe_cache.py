@@ -0,0 +1,130 @@
+import sqlite3
+import hashlib
+import json
+import threading
+import time
+from typing import Dict, Optional
+
+
+def normalize_inputs(
+    ingredients_list: str,
+    cuisine: str,
+    difficulty: str,
+    meal: str,
+    preferences: str,
+    recipe_name: Optional[str],
+) -> Dict[str, object]:
+    """Canonical form of the recipe inputs: case, spacing and ingredient order ignored."""
+
+    def norm(text: Optional[str]) -> str:
+        return " ".join((text or "").lower().split())
+
+    ingredients = sorted({norm(i) for i in ingredients_list.split(",") if norm(i)})
+    return {
+        "ingredients": ingredients,
+        "cuisine": norm(cuisine),
+        "difficulty": norm(difficulty),
+        "meal": norm(meal),
+        "preferences": norm(preferences),
+        "recipe_name": norm(recipe_name) if recipe_name else "",
+    }
+
+
+def cache_key(model_name: str, inputs: Dict[str, object], temperature: float) -> str:
+    payload = {
+        "model": model_name,
+        "inputs": inputs,
+        # 0.7 and 0.72 sample alike; bucket to one decimal
+        "temperature": round(temperature, 1),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+class RecipeCache:
+    """
+    SQLite-backed recipe cache with TTL expiry and least-recently-used
+    eviction once more than `max_entries` rows are stored.
+    """
+
+    def __init__(
+        self,
+        db_path: str = "recipe_cache.db",
+        max_entries: int = 5000,
+        ttl_seconds: float = 7 * 24 * 3600,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute(
+            """
+        CREATE TABLE IF NOT EXISTS recipes (
+          key TEXT PRIMARY KEY,
+          recipe TEXT,
+          created_at REAL,
+          last_used REAL
+        )
+        """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS recipes_last_used ON recipes(last_used)"
+        )
+        self.conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT recipe, created_at FROM recipes WHERE key=?", (key,)
+            ).fetchone()
+            if row and now - row[1] <= self.ttl_seconds:
+                self.conn.execute(
+                    "UPDATE recipes SET last_used=? WHERE key=?", (now, key)
+                )
+                self.conn.commit()
+                self.hits += 1
+                return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, recipe: str):
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "REPLACE INTO recipes(key,recipe,created_at,last_used) VALUES(?,?,?,?)",
+                (key, recipe, now, now),
+            )
+            self._evict(now)
+            self.conn.commit()
+
+    def _evict(self, now: float):
+        self.conn.execute(
+            "DELETE FROM recipes WHERE created_at < ?", (now - self.ttl_seconds,)
+        )
+        self.conn.execute(
+            """
+        DELETE FROM recipes WHERE key IN (
+          SELECT key FROM recipes ORDER BY last_used DESC LIMIT -1 OFFSET ?
+        )
+        """,
+            (self.max_entries,),
+        )
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            (size,) = self.conn.execute("SELECT COUNT(*) FROM recipes").fetchone()
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM recipes")
+            self.conn.commit()
+            self.hits = self.misses = 0
@@ -1,43 +1,131 @@
 # recipe_gen.py
 
 import os
+import copy
+import threading
+import time
+import weakref
 import torch
-from transformers import (
-    BitsAndBytesConfig,
-    AutoTokenizer,
-    AutoModelForCausalLM,
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from lazy_model import LazyModel, hf
+from batcher import GenerationBatcher
+from model_pool import ModelHandle, ModelPool
+from mmap_weights import load_mmap_model, weights_bytes
+from recipe_cache import RecipeCache, cache_key, normalize_inputs
+from recipe_sections import SectionStopping, parse_budgets, section_stats
+from semantic_cache import SemanticRecipeCache, request_scope, request_text
+from cancellation import (
+    CancelStopping,
+    CancelToken,
+    GenerationCancelled,
+    cancel_stats,
 )
-from typing import List, Dict
+from admission import AdmissionController, Overloaded, TierPolicy
+import metrics
+import detect
 
 # ——— Hugging Face authentication ———
 # Read token from env var if you’ve set one via `export HUGGINGFACE_TOKEN=hf_xxx`
 hf_token = os.getenv("HUGGINGFACE_TOKEN")
 token_args = {"use_auth_token": hf_token} if hf_token else {}
 
-# ——— Device & 8-bit config ———
+# ——— Device ———
 device = "cuda" if torch.cuda.is_available() else "cpu"
-bnb_config = BitsAndBytesConfig(load_in_8bit=True)
 
+# ——— CPU precision ———
+# bitsandbytes 8-bit only really works on CUDA. On CPU we pick one of:
+#   "int8": dynamic int8 quantization of every nn.Linear (weights int8,
+#           activations quantized on the fly)
+#   "bf16": bfloat16 weights, when the CPU has native bf16 (AVX512-BF16 / AMX)
+#   "fp32": full precision
+#   "mmap": stored dtype, memory-mapped from the safetensors files so
+#           worker processes share one copy (see worker_pool.py)
+# "auto" (default) takes bf16 where native, otherwise int8.
+cpu_precision = os.getenv("RECIPE_CPU_PRECISION", "auto")
 
-def load_model_and_tokenizer(model_name: str):
+# model name -> precision it was actually loaded with
+loaded_precision: Dict[str, str] = {}
+
+
+def cpu_supports_bf16() -> bool:
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def resolve_cpu_precision(requested: Optional[str] = None) -> str:
+    requested = requested or cpu_precision
+    if requested == "auto":
+        return "bf16" if cpu_supports_bf16() else "int8"
+    if requested not in ("int8", "bf16", "fp32", "mmap"):
+        raise ValueError(
+            f"Unknown CPU precision {requested!r}"
+            " (expected auto, int8, bf16, fp32 or mmap)"
+        )
+    return requested
+
+
+def load_cpu_model(model_name: str, precision: str):
+    if precision == "mmap":
+        return load_mmap_model(model_name, hf_token)
+    AutoModelForCausalLM = hf("AutoModelForCausalLM")
+
+    dtype = torch.bfloat16 if precision == "bf16" else torch.float32
+    model = AutoModelForCausalLM.from_pretrained(
+        model_name, torch_dtype=dtype, **token_args
+    )
+    if precision == "int8":
+        # in place: the default deep-copies the fp32 model first, doubling
+        # peak memory during load
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+    return model
+
+
+def load_model_and_tokenizer(model_name: str, precision: Optional[str] = None):
     """
-    Attempt to load an 8-bit quantized model with device_map; on
+    On CPU, load at the precision chosen by `resolve_cpu_precision`.
+    Otherwise attempt an 8-bit quantized model with device_map; on
     failure (missing accelerate or unsupported), fall back to full-precision.
     """
-    # 1) tokenizer (always small)
+    # transformers is imported here so importing this module stays cheap
+    BitsAndBytesConfig, AutoTokenizer, AutoModelForCausalLM = hf(
+        "BitsAndBytesConfig", "AutoTokenizer", "AutoModelForCausalLM"
+    )
+
+    # 1) tokenizer (always small); left padding for batched decoder-only generate
     tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True, **token_args)
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
 
-    # 2) model: try quantized + device_map
+    # 2) model: CPU int8/bf16, or try quantized + device_map
+    if device == "cpu":
+        precision = resolve_cpu_precision(precision)
+        model = load_cpu_model(model_name, precision)
+        print(f"✅ Loaded {model_name} on CPU with {precision} weights")
+        loaded_precision[model_name] = precision
+        model.eval()
+        return tokenizer, model
+
+    bnb_config = BitsAndBytesConfig(load_in_8bit=True)
     try:
         model = AutoModelForCausalLM.from_pretrained(
             model_name, quantization_config=bnb_config, device_map="auto", **token_args
         )
         print(f"✅ Loaded 8-bit quantized {model_name}")
+        loaded_precision[model_name] = "bnb-int8"
     except (ValueError, ImportError) as e:
         # could be missing accelerate or unsupported quantization
         print(f"⚠️ 8-bit load failed for {model_name} ({e}); loading FP32 instead.")
         model = AutoModelForCausalLM.from_pretrained(model_name, **token_args)
         model.to(device)
+        loaded_precision[model_name] = "fp32"
 
     model.eval()
     return tokenizer, model
@@ -47,15 +135,356 @@ def load_model_and_tokenizer(model_name: str):
 primary = "google/gemma-3-1b-it"
 fallback = "tiiuae/falcon-7b-instruct"
 
-try:
-    tokenizer, model = load_model_and_tokenizer(primary)
-except Exception as exc:
-    print(
-        f"⚠️ Could not load primary model {primary} ({exc}); falling back to {fallback}"
+
+def load_generator(model_name: str):
+    tokenizer, model = load_model_and_tokenizer(model_name)
+    print(f"Using device: {device}  |  Model device: {model.device}")
+    return tokenizer, model
+
+
+# ——— Model pool ———
+# Models load on first use and stay resident, least recently used evicted
+# first, within RECIPE_POOL_MEMORY_GB. A model's size before its first
+# load is taken from its safetensors files. Draft models for speculative
+# decoding (see draft_for) are not pool entries and are not counted
+# against the budget. RECIPE_MODELS registers extra models;
+# RECIPE_TIER_MODELS routes tiers, e.g. "Paid=<bigger model>".
+pool_memory_gb = os.getenv("RECIPE_POOL_MEMORY_GB")
+pool = ModelPool(
+    load_generator,
+    default=primary,
+    memory_budget=int(float(pool_memory_gb) * 2**30) if pool_memory_gb else None,
+    estimate=lambda name: weights_bytes(name, hf_token),
+)
+pool.register(primary, fallback=fallback)
+pool.register(fallback)
+for _name in filter(None, os.getenv("RECIPE_MODELS", "").split(",")):
+    pool.register(_name.strip())
+for _route in filter(None, os.getenv("RECIPE_TIER_MODELS", "").split(",")):
+    _tier, _, _name = _route.partition("=")
+    pool.register(_name.strip(), tiers=(_tier.strip(),))
+
+# The default model; weights load on the first generate call (or via
+# `generator.warm()`)
+generator = ModelHandle(pool)
+
+# ——— Recipe response cache (SQLite, next to users.db) ———
+recipe_cache = RecipeCache(
+    os.getenv("RECIPE_CACHE_DB", "recipe_cache.db"),
+    max_entries=int(os.getenv("RECIPE_CACHE_SIZE", "5000")),
+    ttl_seconds=float(os.getenv("RECIPE_CACHE_TTL", str(7 * 24 * 3600))),
+)
+metrics.register_cache("recipe", recipe_cache)
+
+
+def recipe_cache_key(
+    ingredients_list: str,
+    cuisine: str,
+    difficulty: str,
+    meal: str,
+    preferences: str,
+    recipe_name: Optional[str],
+    temperature: float,
+    model_name: Optional[str] = None,
+) -> str:
+    inputs = normalize_inputs(
+        ingredients_list, cuisine, difficulty, meal, preferences, recipe_name
     )
-    tokenizer, model = load_model_and_tokenizer(fallback)
+    return cache_key(pool.route(model_name), inputs, temperature)
 
-print(f"Using device: {device}  |  Model device: {model.device}")
+
+# ——— Semantic near-duplicate cache ———
+# Misses in the exact cache are looked up among past requests with the
+# same ingredients up to plurals ("onions" is "onion"), preferences,
+# cuisine, meal and cook time; within those, recipe names are compared by
+# CLIP text embedding, so "chicken tikka masala" can reuse "Chicken Tikka
+# Masala curry". Names longer than CLIP's context are never truncated,
+# only not looked up. RECIPE_SEMANTIC_CACHE=0 turns it off; check
+# RECIPE_SEMANTIC_THRESHOLD with `python check_semantic.py`.
+use_semantic_cache = os.getenv("RECIPE_SEMANTIC_CACHE", "1") != "0"
+semantic_cache = SemanticRecipeCache(
+    detect.encode_labels,
+    embedder_name=detect.model_name,
+    threshold=float(os.getenv("RECIPE_SEMANTIC_THRESHOLD", "0.98")),
+    max_entries=int(os.getenv("RECIPE_SEMANTIC_CACHE_SIZE", "2000")),
+    path=os.getenv("RECIPE_SEMANTIC_INDEX", "recipe_semantic.pt"),
+)
+metrics.register_cache("semantic", semantic_cache)
+
+
+def semantic_request(
+    ingredients_list: str,
+    cuisine: str,
+    difficulty: str,
+    meal: str,
+    preferences: str,
+    recipe_name: Optional[str],
+    temperature: float,
+    model_name: str,
+) -> Optional[Tuple[str, str]]:
+    """
+    (scope, text) for `semantic_cache`: only requests in one scope can
+    match. None when the recipe name is too long to embed whole.
+    """
+    inputs = normalize_inputs(
+        ingredients_list, cuisine, difficulty, meal, preferences, recipe_name
+    )
+    text = request_text(inputs)
+    if not detect.text_fits(text):
+        return None
+    scope = f"{model_name}|{round(temperature, 1)}|{request_scope(inputs)}"
+    return scope, text
+
+
+# ——— Shared recipe prompt prefix ———
+# Identical for every request, so its past-key-values are computed once per
+# model and each request only prefills its own suffix (see encode_prompt).
+RECIPE_PROMPT_PREFIX = (
+    "<s>[INST]\n"
+    "You will be asked for a recipe with a recipe name and a list of ingredients.\n"
+    "If the user provides an incorrect or faulty recipe name or ingredients, do not hallucinate—"
+    "instead generate a random recipe using the given ingredients and include at the end:\n"
+    "“⚠️ DISCLAIMER: The user-supplied recipe name or ingredients were invalid; this recipe is a generated approximation.”\n\n"
+    "If any of the ingredients include pork, bacon, ham, lard, or other non-halal items, include at the end of the recipe:\n"
+    "“⚠️ DISCLAIMER: This recipe contains non-halal ingredients and is intended for consumers who do not follow halal dietary restrictions.”\n\n"
+    "The recipe should include:\n"
+    "1. Title\n"
+    "2. Serving\n"
+    "3. Ingredients list with quantities\n"
+    "4. Step-by-step instructions\n"
+    "5. Prep and cook times\n"
+    "6. Nutritional info per serving (calories, macros)\n"
+    "7. Health Data: for each serving, give % of daily recommended values, dietary tags (e.g., vegan, keto, gluten-free), and note key health benefits or cautions\n\n"
+)
+
+# Set RECIPE_PREFIX_CACHE=0 to always prefill the full prompt
+use_prefix_cache = os.getenv("RECIPE_PREFIX_CACHE", "1") != "0"
+_prefix_kv: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_prefix_lock = threading.Lock()
+
+
+def _prefix_state(tokenizer, model, prefix: str):
+    """
+    Token ids and past-key-values for `prefix` minus its last token,
+    computed once per model. The last token is left out because BPE can
+    merge it with the start of the suffix (e.g. "\n\n" + "Create").
+    """
+    with _prefix_lock:
+        per_model = _prefix_kv.setdefault(model, {})
+        if prefix not in per_model:
+            ids = tokenizer(prefix, return_tensors="pt")["input_ids"].to(model.device)
+            ids = ids[:, :-1]
+            with torch.inference_mode():
+                past = model(input_ids=ids, use_cache=True).past_key_values
+            per_model[prefix] = (ids, past)
+        return per_model[prefix]
+
+
+def encode_prompt(tokenizer, model, prompt: str) -> Dict:
+    """
+    Build generate() inputs for `prompt`. The whole prompt is always
+    tokenized as one string; when its ids start with the cached ids of
+    RECIPE_PROMPT_PREFIX, a copy of that prefix's past-key-values is
+    reused so only the rest is prefilled. Otherwise it is a full prefill.
+    """
+    inputs = dict(tokenizer(prompt, return_tensors="pt").to(model.device))
+    if not (use_prefix_cache and prompt.startswith(RECIPE_PROMPT_PREFIX)):
+        return inputs
+    prefix_ids, past = _prefix_state(tokenizer, model, RECIPE_PROMPT_PREFIX)
+    n = prefix_ids.shape[1]
+    ids = inputs["input_ids"]
+    if ids.shape[1] <= n or not torch.equal(ids[:, :n], prefix_ids):
+        return inputs
+    # generate() extends the cache in place, so every request gets a copy
+    inputs["past_key_values"] = copy.deepcopy(past)
+    return inputs
+
+
+# ——— Speculative (assisted) decoding ———
+# A small draft model proposes tokens that the main model verifies in one
+# forward pass. Drafts must share the main model's vocabulary: HF then
+# uses speculative sampling, so outputs follow the same distribution as
+# plain sampling. Falcon has no same-vocabulary draft by default; set
+# RECIPE_FALLBACK_DRAFT_MODEL to one if you have it.
+use_speculative = os.getenv("RECIPE_SPECULATIVE", "0") == "1"
+draft_models: Dict[str, Optional[str]] = {
+    primary: os.getenv("RECIPE_DRAFT_MODEL", "google/gemma-3-270m-it"),
+    fallback: os.getenv("RECIPE_FALLBACK_DRAFT_MODEL") or None,
+}
+_drafts: Dict[str, LazyModel] = {}
+_drafts_lock = threading.Lock()
+
+
+def _load_draft(draft_name: str, tokenizer):
+    draft_tokenizer, draft = load_model_and_tokenizer(draft_name)
+    if draft_tokenizer.get_vocab() != tokenizer.get_vocab():
+        print(f"⚠️ Draft model {draft_name} has a different vocabulary; not using it")
+        return None
+    return draft
+
+
+def draft_for(tokenizer, model):
+    """The draft model paired with `model`, loaded on first use (or None)."""
+    draft_name = draft_models.get(model.name_or_path)
+    if not draft_name:
+        return None
+    with _drafts_lock:
+        if draft_name not in _drafts:
+            loader = lambda: _load_draft(draft_name, tokenizer)
+            _drafts[draft_name] = LazyModel(loader, name=draft_name)
+    return _drafts[draft_name].get()
+
+
+class DecodeStats:
+    """
+    Running decode counters. Acceptance is estimated from forward passes:
+    each main-model pass yields its accepted draft tokens plus one, and
+    each draft pass proposes one token.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.new_tokens = 0
+        self.seconds = 0.0
+        self.target_forwards = 0
+        self.draft_forwards = 0
+        self._lock = threading.Lock()
+
+    def record(self, new_tokens: int, seconds: float, forwards: Dict[str, int]):
+        with self._lock:
+            self.calls += 1
+            self.new_tokens += new_tokens
+            self.seconds += seconds
+            self.target_forwards += forwards["target"]
+            self.draft_forwards += forwards["draft"]
+
+    def report(self) -> Dict[str, float]:
+        accepted = max(self.new_tokens - self.target_forwards, 0)
+        return {
+            "calls": self.calls,
+            "new_tokens": self.new_tokens,
+            "tokens_per_sec": self.new_tokens / self.seconds if self.seconds else 0.0,
+            "acceptance_rate": (
+                accepted / self.draft_forwards if self.draft_forwards else 0.0
+            ),
+        }
+
+
+decode_stats = {"plain": DecodeStats(), "speculative": DecodeStats()}
+
+
+class StepClock:
+    """
+    Stopping criterion that never stops: it timestamps the first decode
+    step and, per row, the last step that produced a non-pad token, for
+    the prefill and per-row decode-rate metrics.
+    """
+
+    def __init__(self, pad_token_id: Optional[int]):
+        self.pad_token_id = pad_token_id
+        self.first: Optional[float] = None
+        self.last: List[float] = []
+
+    def __call__(self, input_ids: torch.Tensor, scores, **kwargs) -> torch.Tensor:
+        now = time.perf_counter()
+        if self.first is None:
+            self.first = now
+            self.last = [now] * input_ids.shape[0]
+        else:
+            for i, token in enumerate(input_ids[:, -1].tolist()):
+                if token != self.pad_token_id:
+                    self.last[i] = now
+        return torch.zeros(
+            input_ids.shape[0], dtype=torch.bool, device=input_ids.device
+        )
+
+
+# forward-pass counters for the generate call running on this thread
+_forwards = threading.local()
+_hooked: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def _count_forwards(module: torch.nn.Module, role: str):
+    def hook(*_):
+        counts = getattr(_forwards, "counts", None)
+        if counts is not None:
+            counts[role] += 1
+
+    if module not in _hooked:
+        module.register_forward_hook(hook)
+        _hooked.add(module)
+
+
+def run_generate(
+    tokenizer, model, inputs: Dict, speculative: Optional[bool] = None, **kwargs
+) -> torch.Tensor:
+    """
+    model.generate(**inputs, **kwargs), assisted by the draft model when
+    `speculative` (default: RECIPE_SPECULATIVE) is on and the batch has a
+    single row. Records tokens/sec and acceptance in `decode_stats` and
+    the prompt, prefill and decode metrics.
+    """
+    StoppingCriteriaList = hf("StoppingCriteriaList")
+
+    if speculative is None:
+        speculative = use_speculative
+    draft = None
+    if speculative and inputs["input_ids"].shape[0] == 1:
+        draft = draft_for(tokenizer, model)
+    if draft is not None:
+        kwargs["assistant_model"] = draft
+        _count_forwards(draft, "draft")
+    _count_forwards(model, "target")
+
+    pad_token_id = kwargs.get("pad_token_id", tokenizer.pad_token_id)
+    clock = StepClock(pad_token_id)
+    kwargs["stopping_criteria"] = StoppingCriteriaList(
+        [*kwargs.get("stopping_criteria", []), clock]
+    )
+
+    _forwards.counts = {"target": 0, "draft": 0}
+    start = time.perf_counter()
+    try:
+        with torch.inference_mode():
+            out = model.generate(**inputs, **kwargs)
+        forwards = _forwards.counts
+    finally:
+        _forwards.counts = None
+    end = time.perf_counter()
+    prompt_len = inputs["input_ids"].shape[1]
+    decode_stats["speculative" if draft is not None else "plain"].record(
+        out.numel() - out.shape[0] * prompt_len, end - start, forwards
+    )
+    _record_generate(inputs, out[:, prompt_len:], pad_token_id, start, end, clock)
+    return out
+
+
+def _record_generate(
+    inputs: Dict,
+    new_ids: torch.Tensor,
+    pad_token_id: Optional[int],
+    start: float,
+    end: float,
+    clock: StepClock,
+):
+    metrics.generation_seconds.observe(end - start)
+    mask = inputs.get("attention_mask")
+    lengths = (
+        mask.sum(dim=1).tolist()
+        if mask is not None
+        else [inputs["input_ids"].shape[1]] * new_ids.shape[0]
+    )
+    for length in lengths:
+        metrics.prompt_tokens.observe(length)
+    if clock.first is None:
+        return  # nothing was decoded
+    metrics.prefill_seconds.observe(clock.first - start)
+    # the first step's token comes out of prefill; the rest are decode
+    for tokens, last in zip((new_ids != pad_token_id).sum(dim=1).tolist(), clock.last):
+        if tokens > 1 and last > clock.first:
+            metrics.decode_tokens_per_second.observe(
+                (tokens - 1) / (last - clock.first)
+            )
 
 
 def generate_text(
@@ -64,52 +493,689 @@ def generate_text(
     temperature: float = 0.7,
     top_p: float = 0.95,
     repetition_penalty: float = 1.1,
+    speculative: Optional[bool] = None,
+    model_name: Optional[str] = None,
+    cancel: Optional[CancelToken] = None,
 ) -> str:
-    inputs = tokenizer(prompt, return_tensors="pt").to(device)
-    with torch.inference_mode():
-        out = model.generate(
-            **inputs,
-            max_new_tokens=max_new_tokens,
-            temperature=temperature,
-            top_p=top_p,
-            repetition_penalty=repetition_penalty,
-        )
-    text = tokenizer.decode(out[0], skip_special_tokens=True)
+    """Raises GenerationCancelled if `cancel` fires before the text is done."""
+    StoppingCriteriaList = hf("StoppingCriteriaList")
+
+    tokenizer, model = pool.get(model_name)
+    inputs = encode_prompt(tokenizer, model, prompt)
+    stop = CancelStopping([cancel], inputs["input_ids"].shape[1], max_new_tokens)
+    out = run_generate(
+        tokenizer,
+        model,
+        inputs,
+        speculative,
+        max_new_tokens=max_new_tokens,
+        temperature=temperature,
+        top_p=top_p,
+        repetition_penalty=repetition_penalty,
+        stopping_criteria=StoppingCriteriaList([stop]),
+    )
+    stop.finish()
+    if cancel is not None and cancel.cancelled:
+        raise GenerationCancelled("Generation was cancelled")
+    return _strip_inst(tokenizer.decode(out[0], skip_special_tokens=True))
+
+
+def _strip_inst(text: str) -> str:
     return text.split("[/INST]")[-1].strip() if "[/INST]" in text else text
 
 
-def generate_recipe(
+class RowTemperature:
+    """Logits processor that scales each batch row by its own temperature."""
+
+    def __init__(self, temperatures: List[float]):
+        self.temperatures = torch.tensor(temperatures).unsqueeze(1)
+
+    def __call__(self, input_ids: torch.Tensor, scores: torch.Tensor) -> torch.Tensor:
+        return scores / self.temperatures.to(scores.device, scores.dtype)
+
+
+class RowLimit:
+    """Stopping criterion that ends row i after `limits[i]` new tokens (None: no cap)."""
+
+    def __init__(self, limits: List[Optional[int]], prompt_len: int):
+        self.limits = limits
+        self.prompt_len = prompt_len
+
+    def __call__(self, input_ids: torch.Tensor, scores, **kwargs) -> torch.Tensor:
+        generated = input_ids.shape[1] - self.prompt_len
+        done = [limit is not None and generated >= limit for limit in self.limits]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+class RowStreamer:
+    """
+    Streamer for batched generate(): skips the prompt and forwards each
+    row's new token to that row's own streamer (e.g. a
+    TextIteratorStreamer), ending a row as soon as it emits EOS. With
+    `settled` (see SectionStopping.settled), tokens are held back until
+    they can no longer be cut, so streamed text matches the returned text.
+    """
+
+    def __init__(
+        self,
+        streamers: List[Optional[Any]],
+        eos_token_ids: List[int],
+        settled: Optional[Callable[[int, bool], Optional[int]]] = None,
+    ):
+        self.streamers = streamers
+        self.eos_token_ids = set(eos_token_ids)
+        self.settled = settled
+        self.done = [s is None for s in streamers]
+        self.held: List[List[int]] = [[] for _ in streamers]
+        self.sent = [0] * len(streamers)
+        self._prompt_seen = False
+
+    def put(self, value: torch.Tensor):
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        tokens = value.reshape(-1).tolist()
+        # batched steps carry one token per row; assisted decoding (single
+        # row only) can emit several tokens for that row at once
+        per_row = [tokens] if len(self.streamers) == 1 else [[t] for t in tokens]
+        for i, (streamer, row) in enumerate(zip(self.streamers, per_row)):
+            for token in row:
+                if self.done[i]:
+                    break
+                if token in self.eos_token_ids:
+                    self._end_row(i)
+                else:
+                    self.held[i].append(token)
+            if not self.done[i]:
+                self._release(i)
+
+    def end(self):
+        for i in range(len(self.streamers)):
+            if not self.done[i]:
+                self._end_row(i)
+
+    def _release(self, i: int, final: bool = False):
+        limit = self.settled(i, final) if self.settled else None
+        held = self.held[i]
+        n = len(held) if limit is None else min(len(held), limit - self.sent[i])
+        if n > 0:
+            self.streamers[i].put(torch.tensor(held[:n]))
+            self.sent[i] += n
+            del held[:n]
+
+    def _end_row(self, i: int):
+        self._release(i, final=True)
+        self.held[i].clear()  # cut off: not part of the completion
+        self.done[i] = True
+        self.streamers[i].end()
+
+
+# ——— Section-aware stopping ———
+# Recipe prompts stop once the model starts over after the last requested
+# section (see recipe_sections.SectionStopping) instead of always running
+# to max_new_tokens. RECIPE_SECTION_BUDGETS optionally caps sections in
+# tokens, e.g. "ingredients=200,health=150".
+use_section_stop = os.getenv("RECIPE_SECTION_STOP", "1") != "0"
+section_budgets = parse_budgets(os.getenv("RECIPE_SECTION_BUDGETS", ""))
+
+
+class Completion(NamedTuple):
+    """One generated row and why it was stopped early, if it was."""
+
+    text: str
+    stop_reason: Optional[str] = None  # "repeat", "budget" or "cancelled"
+
+    @property
+    def complete(self) -> bool:
+        """False when the text was cut short (a repeat is trimmed off whole)."""
+        return self.stop_reason in (None, "repeat")
+
+
+def generate_text_batch(
+    prompts: List[str],
+    temperatures: Optional[List[float]] = None,
+    max_new_tokens: int = 750,
+    top_p: float = 0.95,
+    repetition_penalty: float = 1.1,
+    streamers: Optional[List[Optional[Any]]] = None,
+    model_name: Optional[str] = None,
+    cancel_tokens: Optional[List[Optional[CancelToken]]] = None,
+    row_max_new_tokens: Optional[List[Optional[int]]] = None,
+) -> List[Completion]:
+    """
+    Generate completions for several prompts in one left-padded batch.
+    Each row samples with its own temperature (applied before top-p, as
+    the built-in warper would be). A single prompt takes the prefix
+    KV-cache path instead of padding. `streamers[i]`, if given, receives
+    row i's tokens (skip_prompt=False; the prompt is never sent). Recipe
+    prompts stop at the end of the recipe and are trimmed to it. Row i
+    stops as soon as `cancel_tokens[i]` is cancelled; its text is partial.
+    `row_max_new_tokens[i]` caps row i below `max_new_tokens`. Each
+    Completion carries the row's stop reason: "repeat" or "budget" from
+    SectionStopping, or "cancelled".
+    """
+    LogitsProcessorList, StoppingCriteriaList = hf(
+        "LogitsProcessorList", "StoppingCriteriaList"
+    )
+
+    tokenizer, model = pool.get(model_name)
+    temperatures = temperatures or [0.7] * len(prompts)
+    if len(prompts) == 1:
+        inputs = encode_prompt(tokenizer, model, prompts[0])
+    else:
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True)
+        inputs = dict(inputs.to(model.device))
+    eos = model.generation_config.eos_token_id
+    end_ids = eos if isinstance(eos, list) else [eos]
+    # finished rows are filled with padding until the whole batch is done
+    end_ids = [e for e in end_ids + [tokenizer.pad_token_id] if e is not None]
+    prompt_len = inputs["input_ids"].shape[1]
+    limits = [
+        min(limit, max_new_tokens) if limit else None
+        for limit in (row_max_new_tokens or [None] * len(prompts))
+    ]
+    # no need to decode past the largest cap when every row has one
+    max_new_tokens = max(limit or max_new_tokens for limit in limits)
+    sections = SectionStopping(
+        tokenizer,
+        prompt_len,
+        max_new_tokens,
+        [use_section_stop and p.startswith(RECIPE_PROMPT_PREFIX) for p in prompts],
+        end_ids,
+        section_budgets,
+    )
+    streamer = None
+    if streamers and any(s is not None for s in streamers):
+        streamer = RowStreamer(streamers, end_ids, sections.settled)
+    cancels = CancelStopping(
+        cancel_tokens or [None] * len(prompts), prompt_len, max_new_tokens
+    )
+    out = run_generate(
+        tokenizer,
+        model,
+        inputs,
+        max_new_tokens=max_new_tokens,
+        do_sample=True,
+        temperature=1.0,
+        top_p=top_p,
+        repetition_penalty=repetition_penalty,
+        logits_processor=LogitsProcessorList([RowTemperature(temperatures)]),
+        stopping_criteria=StoppingCriteriaList(
+            [sections, cancels, RowLimit(limits, prompt_len)]
+        ),
+        pad_token_id=tokenizer.pad_token_id,
+        streamer=streamer,
+    )
+    sections.finish()
+    cancels.finish()
+    for i, cut in enumerate(sections.cut):
+        if cut is not None:
+            out[i, prompt_len + cut :] = tokenizer.pad_token_id
+    reasons = [
+        "cancelled" if at is not None else reason
+        for at, reason in zip(cancels.stopped_at, sections.reasons)
+    ]
+    texts = tokenizer.batch_decode(out, skip_special_tokens=True)
+    return [Completion(_strip_inst(t), r) for t, r in zip(texts, reasons)]
+
+
+# ——— Admission control ———
+# Paid requests are taken from the queue first. Once the queue is
+# RECIPE_FREE_MAX_QUEUE deep, Free requests get RECIPE_FREE_OVERLOAD:
+# "downgrade" (a shorter token budget), "cache_only" or "shed"; past
+# RECIPE_FREE_SHED_QUEUE they are always shed. Paid requests are only
+# shed past RECIPE_PAID_MAX_QUEUE. Batch (offline bulk_generate work)
+# runs after both and always waits its turn at full length. A tier's
+# queue depth only counts requests that are served before or with it.
+admission = AdmissionController(
+    {
+        "Paid": TierPolicy(
+            priority=0,
+            max_queue=int(os.getenv("RECIPE_PAID_MAX_QUEUE", "64")),
+            on_overload="shed",
+        ),
+        "Free": TierPolicy(
+            priority=1,
+            max_queue=int(os.getenv("RECIPE_FREE_MAX_QUEUE", "8")),
+            on_overload=os.getenv("RECIPE_FREE_OVERLOAD", "downgrade"),
+            downgrade_tokens=int(os.getenv("RECIPE_FREE_DOWNGRADE_TOKENS", "300")),
+            shed_queue=int(os.getenv("RECIPE_FREE_SHED_QUEUE", "32")),
+        ),
+        "Batch": TierPolicy(priority=2, max_queue=0, on_overload="queue"),
+    },
+    default_tier="Free",
+)
+
+
+# ——— Cross-session batching ———
+# Every generate_recipe call, from any Streamlit session, goes through one
+# worker per model that merges concurrent requests into batches.
+_batchers: Dict[str, GenerationBatcher] = {}
+_batchers_lock = threading.Lock()
+
+
+def batcher_for(model_name: str) -> GenerationBatcher:
+    with _batchers_lock:
+        if model_name not in _batchers:
+            _batchers[model_name] = GenerationBatcher(
+                lambda prompts, temps, streamers, cancels, limits: generate_text_batch(
+                    prompts,
+                    temps,
+                    streamers=streamers,
+                    model_name=model_name,
+                    cancel_tokens=cancels,
+                    row_max_new_tokens=limits,
+                ),
+                max_batch_size=int(os.getenv("RECIPE_MAX_BATCH_SIZE", "4")),
+                max_wait=float(os.getenv("RECIPE_MAX_WAIT_MS", "50")) / 1000,
+                name=f"generation-batcher-{model_name}",
+            )
+        return _batchers[model_name]
+
+
+def submit_recipe(
+    model_name: str,
+    tier: Optional[str],
+    prompt: str,
+    temperature: float,
+    streamer: Optional[Any] = None,
+    cancel: Optional[CancelToken] = None,
+) -> Tuple[Future, bool]:
+    """
+    Queue a recipe prompt under `tier`'s admission policy. Returns the
+    future and whether its result is a full recipe, i.e. worth caching
+    (downgraded ones are cut short). Raises Overloaded if the request is
+    shed or only cached recipes may be served.
+    """
+    batcher = batcher_for(model_name)
+    depth = sum(batcher.pending(label) for label in admission.ahead(tier))
+    admitted = admission.admit(tier, depth)
+    if admitted.action in ("shed", "cache_only"):
+        raise Overloaded(
+            f"Recipe generation is busy ({depth} requests queued); please try again"
+        )
+    future = batcher.submit(
+        prompt,
+        temperature,
+        streamer,
+        cancel,
+        priority=admitted.priority,
+        max_new_tokens=admitted.max_new_tokens,
+        label=admission.tier(tier),
+    )
+    return future, admitted.action == "admit"
+
+
+def scheduler_stats() -> Dict[str, object]:
+    """Admission outcomes per tier, plus queue length and wait per model."""
+    with _batchers_lock:
+        batchers = dict(_batchers)
+    return {
+        "admission": admission.stats(),
+        "queues": {name: b.stats() for name, b in batchers.items()},
+    }
+
+
+# ——— Scheduler, cancellation and decode metrics ———
+def _by(label: str, values: Dict[str, float]) -> Dict[metrics.Labels, float]:
+    return {((label, key),): value for key, value in values.items()}
+
+
+def _admissions() -> Dict[metrics.Labels, float]:
+    return {
+        (("tier", tier), ("action", action)): count
+        for tier, counts in admission.stats().items()
+        for action, count in counts.items()
+    }
+
+
+def _queue_lengths() -> Dict[metrics.Labels, float]:
+    return {
+        (("model", name), ("tier", tier)): count
+        for name, queue in scheduler_stats()["queues"].items()
+        for tier, count in queue["queued"].items()
+    }
+
+
+def _cancelled() -> Dict[metrics.Labels, float]:
+    report = cancel_stats.report()
+    stages = {"queued": report["queued"]}
+    stages["decoding"] = report["cancelled"] - report["queued"]
+    return _by("stage", stages)
+
+
+metrics.collect(
+    "recipe_admissions_total", "Admission decisions, by tier", "counter", _admissions
+)
+metrics.collect(
+    "recipe_queue_length", "Queued generation requests", "gauge", _queue_lengths
+)
+metrics.collect(
+    "recipe_cancelled_total", "Cancelled requests, by stage", "counter", _cancelled
+)
+metrics.collect(
+    "recipe_cancelled_tokens_total",
+    "Tokens cancelled requests decoded (wasted) or skipped (avoided)",
+    "counter",
+    lambda: _by(
+        "kind",
+        {
+            "wasted": cancel_stats.report()["tokens_wasted"],
+            "avoided": cancel_stats.report()["tokens_avoided"],
+        },
+    ),
+)
+metrics.collect(
+    "recipe_section_stops_total",
+    "Recipe rows stopped before max_new_tokens, by reason",
+    "counter",
+    lambda: _by("reason", section_stats.report()["stopped"]),
+)
+metrics.collect(
+    "recipe_section_tokens_total",
+    "Tokens recipe rows decoded (generated) or skipped by stopping early (saved)",
+    "counter",
+    lambda: _by(
+        "kind",
+        {
+            "generated": section_stats.report()["tokens_generated"],
+            "saved": section_stats.report()["tokens_saved"],
+        },
+    ),
+)
+metrics.collect(
+    "recipe_decode_tokens_total",
+    "Tokens generate() calls produced, by mode (plain or speculative)",
+    "counter",
+    lambda: _by("mode", {m: s.report()["new_tokens"] for m, s in decode_stats.items()}),
+)
+metrics.collect(
+    "recipe_speculative_acceptance_ratio",
+    "Share of draft tokens the main model accepted",
+    "gauge",
+    lambda: {(): decode_stats["speculative"].report()["acceptance_rate"]},
+)
+
+
+def _strip_inst_stream(chunks: Iterator[str], marker: str = "[/INST]") -> Iterator[str]:
+    """
+    Streaming version of the `[/INST]` split in generate_text: the output
+    is stripped and an echoed marker restarts the text, dropping whatever
+    is still buffered before it (already-yielded text cannot be taken
+    back). Enough of the tail is held back that a marker split across
+    chunks is still caught.
+    """
+    buf = ""
+    started = False
+    for chunk in chunks:
+        buf += chunk
+        if marker in buf:
+            buf = buf.split(marker)[-1]
+            started = False
+        if not started:
+            buf = buf.lstrip()
+        cut = min(len(buf) - (len(marker) - 1), len(buf.rstrip()))
+        if cut > 0:
+            started = True
+            yield buf[:cut]
+            buf = buf[cut:]
+    tail = buf.rstrip() if started else buf.strip()
+    if tail:
+        yield tail
+
+
+def generate_text_stream(
+    prompt: str,
+    max_new_tokens: int = 750,
+    temperature: float = 0.7,
+    top_p: float = 0.95,
+    repetition_penalty: float = 1.1,
+    speculative: Optional[bool] = None,
+    model_name: Optional[str] = None,
+    cancel: Optional[CancelToken] = None,
+) -> Iterator[str]:
+    """
+    Like generate_text, but yields decoded text chunks as tokens are
+    produced. Only the completion is streamed (the prompt is skipped).
+    Generation stops when `cancel` fires or the consumer stops iterating.
+    """
+    StoppingCriteriaList, TextIteratorStreamer = hf(
+        "StoppingCriteriaList", "TextIteratorStreamer"
+    )
+
+    start = time.monotonic()
+    tokenizer, model = pool.get(model_name)
+    inputs = encode_prompt(tokenizer, model, prompt)
+    streamer = TextIteratorStreamer(
+        tokenizer, skip_prompt=True, skip_special_tokens=True
+    )
+    cancel = cancel or CancelToken()
+    stop = CancelStopping([cancel], inputs["input_ids"].shape[1], max_new_tokens)
+    error: List[BaseException] = []
+
+    def run():
+        try:
+            run_generate(
+                tokenizer,
+                model,
+                inputs,
+                speculative,
+                max_new_tokens=max_new_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                repetition_penalty=repetition_penalty,
+                streamer=streamer,
+                stopping_criteria=StoppingCriteriaList([stop]),
+            )
+            stop.finish()
+        except BaseException as exc:
+            error.append(exc)
+            streamer.end()  # unblock the consumer
+
+    thread = threading.Thread(target=run, name="generate-stream", daemon=True)
+    thread.start()
+    try:
+        for n, chunk in enumerate(_strip_inst_stream(streamer)):
+            if n == 0:
+                metrics.ttft_seconds.observe(time.monotonic() - start, path="stream")
+            yield chunk
+    except GeneratorExit:
+        cancel.cancel()  # the consumer went away (e.g. a Streamlit rerun)
+        raise
+    thread.join()
+    if error:
+        raise error[0]
+    if cancel.cancelled:
+        raise GenerationCancelled("Generation was cancelled")
+    metrics.request_seconds.observe(time.monotonic() - start, path="stream")
+
+
+def build_recipe_prompt(
     ingredients_list: str,
     cuisine: str,
     difficulty: str,
     meal: str,
     preferences: str,
-    recipe_name: str,
-    temperature: float = 0.7,
+    recipe_name: Optional[str],
 ) -> str:
-    prompt = (
-        "<s>[INST]\n"
+    # Request-specific fields go last so RECIPE_PROMPT_PREFIX can be KV-cached
+    return RECIPE_PROMPT_PREFIX + (
         f"Create a detailed recipe for: {recipe_name} but using these ingredients: {ingredients_list}\n"
-        "If the user provides an incorrect or faulty recipe name or ingredients, do not hallucinate—"
-        "instead generate a random recipe using the given ingredients and include at the end:\n"
-        "“⚠️ DISCLAIMER: The user-supplied recipe name or ingredients were invalid; this recipe is a generated approximation.”\n\n"
         f"Cuisine type: {cuisine}\n"
         f"Cook Time: {difficulty}\n"
         f"Meal type: {meal}\n"
-        f"Additional preferences: {preferences}\n\n"
-        "If any of the ingredients include pork, bacon, ham, lard, or other non-halal items, include at the end of the recipe:\n"
-        "“⚠️ DISCLAIMER: This recipe contains non-halal ingredients and is intended for consumers who do not follow halal dietary restrictions.”\n\n"
-        "The recipe should include:\n"
-        "1. Title\n"
-        "2. Serving\n"
-        "3. Ingredients list with quantities\n"
-        "4. Step-by-step instructions\n"
-        "5. Prep and cook times\n"
-        "6. Nutritional info per serving (calories, macros)\n"
-        "7. Health Data: for each serving, give % of daily recommended values, dietary tags (e.g., vegan, keto, gluten-free), and note key health benefits or cautions\n"
+        f"Additional preferences: {preferences}\n"
         "[/INST]"
     )
-    return generate_text(prompt, temperature=temperature)
+
+
+class RecipeResult(NamedTuple):
+    text: str
+    cached: bool  # served from recipe_cache or semantic_cache
+    model_name: str  # the routed model
+
+
+def generate_recipe(
+    ingredients_list: str,
+    cuisine: str,
+    difficulty: str,
+    meal: str,
+    preferences: str,
+    recipe_name: str,
+    temperature: float = 0.7,
+    fresh: bool = False,
+    tier: Optional[str] = None,
+    model_name: Optional[str] = None,
+    cancel: Optional[CancelToken] = None,
+) -> str:
+    """
+    Generate a recipe with `model_name`, or the model routed to `tier`
+    (e.g. the user's subscription). Served from `recipe_cache` unless
+    `fresh` is set. Raises GenerationCancelled if `cancel` fires first and
+    Overloaded when admission control turns the request away.
+    """
+    return generate_recipe_result(
+        ingredients_list,
+        cuisine,
+        difficulty,
+        meal,
+        preferences,
+        recipe_name,
+        temperature,
+        fresh,
+        tier,
+        model_name,
+        cancel,
+    ).text
+
+
+def generate_recipe_result(
+    ingredients_list: str,
+    cuisine: str,
+    difficulty: str,
+    meal: str,
+    preferences: str,
+    recipe_name: str,
+    temperature: float = 0.7,
+    fresh: bool = False,
+    tier: Optional[str] = None,
+    model_name: Optional[str] = None,
+    cancel: Optional[CancelToken] = None,
+) -> RecipeResult:
+    """generate_recipe, also telling whether it was a cache hit and which model."""
+    model_name = pool.route(model_name, tier)
+    key = recipe_cache_key(
+        ingredients_list,
+        cuisine,
+        difficulty,
+        meal,
+        preferences,
+        recipe_name,
+        temperature,
+        model_name,
+    )
+    near = None
+    if not fresh:
+        cached = recipe_cache.get(key)
+        if cached is None and use_semantic_cache:
+            near = semantic_request(
+                ingredients_list,
+                cuisine,
+                difficulty,
+                meal,
+                preferences,
+                recipe_name,
+                temperature,
+                model_name,
+            )
+            if near:
+                cached, query = semantic_cache.lookup(*near)
+        if cached is not None:
+            return RecipeResult(cached, True, model_name)
+    prompt = build_recipe_prompt(
+        ingredients_list, cuisine, difficulty, meal, preferences, recipe_name
+    )
+    future, complete = submit_recipe(
+        model_name, tier, prompt, temperature, cancel=cancel
+    )
+    result = future.result()
+    # downgraded and budget-stopped recipes are cut short: serve, don't cache
+    if complete and result.complete:
+        recipe_cache.put(key, result.text)
+        if near:
+            semantic_cache.add(*near, result.text, query)
+    return RecipeResult(result.text, False, model_name)
+
+
+def generate_recipe_stream(
+    ingredients_list: str,
+    cuisine: str,
+    difficulty: str,
+    meal: str,
+    preferences: str,
+    recipe_name: str,
+    temperature: float = 0.7,
+    fresh: bool = False,
+    tier: Optional[str] = None,
+    model_name: Optional[str] = None,
+    cancel: Optional[CancelToken] = None,
+) -> Iterator[str]:
+    """
+    Streaming generate_recipe. Generation stops when `cancel` fires or
+    the consumer stops iterating (e.g. the Streamlit script reruns).
+    Raises Overloaded when admission control turns the request away.
+    """
+    model_name = pool.route(model_name, tier)
+    key = recipe_cache_key(
+        ingredients_list,
+        cuisine,
+        difficulty,
+        meal,
+        preferences,
+        recipe_name,
+        temperature,
+        model_name,
+    )
+    near = None
+    if not fresh:
+        cached = recipe_cache.get(key)
+        if cached is None and use_semantic_cache:
+            near = semantic_request(
+                ingredients_list,
+                cuisine,
+                difficulty,
+                meal,
+                preferences,
+                recipe_name,
+                temperature,
+                model_name,
+            )
+            if near:
+                cached, query = semantic_cache.lookup(*near)
+        if cached is not None:
+            yield cached
+            return
+    prompt = build_recipe_prompt(
+        ingredients_list, cuisine, difficulty, meal, preferences, recipe_name
+    )
+    TextIteratorStreamer = hf("TextIteratorStreamer")
+
+    tokenizer, _ = pool.get(model_name)
+    streamer = TextIteratorStreamer(tokenizer, skip_special_tokens=True)
+    cancel = cancel or CancelToken()
+    future, complete = submit_recipe(
+        model_name, tier, prompt, temperature, streamer, cancel
+    )
+    try:
+        yield from _strip_inst_stream(streamer)
+    except GeneratorExit:
+        cancel.cancel()
+        raise
+    result = future.result()
+    if complete and result.complete:
+        recipe_cache.put(key, result.text)
+        if near:
+            semantic_cache.add(*near, result.text, query)
 
 
 def get_default_questions() -> List[Dict]:
@@ -163,20 +1229,39 @@ def generate_specific_question(ingredients_list: str) -> Dict:
 
 
 def generate_recipe_options(
-    ingredients: str, cuisine: str, difficulty: str, meal: str, preferences: str
+    ingredients: str,
+    cuisine: str,
+    difficulty: str,
+    meal: str,
+    preferences: str,
+    tier: Optional[str] = None,
 ) -> List[Dict[str, str]]:
     styles = ["simple and quick", "elaborate and impressive", "creative and unique"]
     temps = [0.7, 0.8, 0.9]
-    results = []
-    for style, temp in zip(styles, temps):
-        full = generate_recipe(
+    prompts = [
+        build_recipe_prompt(
             ingredients,
             cuisine,
             difficulty,
             meal,
             preferences + f"; for this option, make it {style}",
-            temperature=temp,
+            recipe_name=None,
         )
+        for style in styles
+    ]
+    # submitted together, so the batcher runs them as one padded batch
+    model_name = pool.route(tier=tier)
+    cancel = CancelToken()
+    futures = []
+    try:
+        for p, t in zip(prompts, temps):
+            futures.append(submit_recipe(model_name, tier, p, t, cancel=cancel)[0])
+    except Overloaded:
+        cancel.cancel()  # options are served together or not at all
+        raise
+    results = []
+    for style, future in zip(styles, futures):
+        full = future.result().text
         title = next((ln for ln in full.splitlines() if ln.strip()), style.title())
         if len(title) > 60:
             title = title[:57] + "…"
@@ -0,0 +1,206 @@
+import re
+import threading
+from typing import Dict, List, Optional
+import torch
+
+# The seven sections RECIPE_PROMPT_PREFIX asks for, in order, with the
+# heading words that open each one
+SECTIONS = [
+    ("title", r"title\b"),
+    ("serving", r"(servings?|serves|yield)\b"),
+    ("ingredients", r"ingredients?\b"),
+    ("instructions", r"(step[- ]by[- ]step|instructions|directions|method|steps)\b"),
+    ("times", r"((prep\w*|cook\w*|total)( and cook\w*)? times?|times)\b"),
+    ("nutrition", r"nutrition"),
+    ("health", r"health"),
+]
+SECTION_NAMES = [name for name, _ in SECTIONS]
+_section_patterns = [re.compile(pattern) for _, pattern in SECTIONS]
+
+# markdown / numbering in front of a heading: "## 3. Ingredients", "**Title:**"
+_heading_marker = re.compile(r"^(#+|\*\*|\d+[.)]\s)")
+_heading_prefix = re.compile(r"^[#*_\s\d.)]+")
+
+
+def parse_budgets(spec: str) -> Dict[str, int]:
+    """'ingredients=200,health=150' -> {'ingredients': 200, 'health': 150}"""
+    budgets = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, tokens = part.partition("=")
+        name = name.strip().lower()
+        if name not in SECTION_NAMES:
+            raise ValueError(f"Unknown recipe section {name!r} in budgets")
+        budgets[name] = int(tokens)
+    return budgets
+
+
+class SectionStats:
+    """Running totals of how generation ended and the tokens it did not spend."""
+
+    def __init__(self):
+        self.rows = 0
+        self.stopped: Dict[str, int] = {}
+        self.tokens_generated = 0
+        self.tokens_saved = 0
+        self._lock = threading.Lock()
+
+    def record(self, generated: int, saved: int, reason: Optional[str]):
+        with self._lock:
+            self.rows += 1
+            self.tokens_generated += generated
+            self.tokens_saved += saved
+            if reason:
+                self.stopped[reason] = self.stopped.get(reason, 0) + 1
+
+    def report(self) -> Dict[str, object]:
+        total = self.tokens_generated + self.tokens_saved
+        return {
+            "rows": self.rows,
+            "stopped": dict(self.stopped),
+            "tokens_generated": self.tokens_generated,
+            "tokens_saved": self.tokens_saved,
+            "saved_fraction": self.tokens_saved / total if total else 0.0,
+        }
+
+
+section_stats = SectionStats()
+
+
+class _RowState:
+    def __init__(self):
+        self.seen = 0  # generated tokens looked at so far
+        self.line_start = 0
+        self.section = -1
+        self.section_start = 0
+        self.ended = False  # emitted EOS / padding
+        self.reason: Optional[str] = None
+        self.cut: Optional[int] = None  # trim the completion from this token
+
+
+class SectionStopping:
+    """
+    Stopping criterion that follows the recipe's section headings as they
+    are generated, line by line, and stops a row when
+
+    - "repeat": the last section is under way and an earlier section
+      heading comes round again
+    - "budget": the current section ran past its entry in `budgets`
+
+    A sign-off ("Enjoy!") does not stop a row: the Health section's
+    ⚠️ DISCLAIMER lines may still follow it, so rows otherwise run to EOS.
+    For "repeat" the offending line is not part of the recipe; `cut[i]`
+    is the completion token it starts at. Rows whose
+    `active` flag is False are never stopped; tokens in `end_token_ids`
+    (EOS, padding) end a row's tracking.
+    """
+
+    def __init__(
+        self,
+        tokenizer,
+        prompt_len: int,
+        max_new_tokens: int,
+        active: List[bool],
+        end_token_ids: List[int],
+        budgets: Optional[Dict[str, int]] = None,
+    ):
+        self.tokenizer = tokenizer
+        self.prompt_len = prompt_len
+        self.max_new_tokens = max_new_tokens
+        self.active = active
+        self.end_token_ids = set(end_token_ids)
+        self.budgets = budgets or {}
+        self.rows = [_RowState() for _ in active]
+        self._newline: Dict[int, bool] = {}
+
+    @property
+    def cut(self) -> List[Optional[int]]:
+        return [row.cut for row in self.rows]
+
+    @property
+    def reasons(self) -> List[Optional[str]]:
+        return [row.reason for row in self.rows]
+
+    def settled(self, i: int, final: bool = False) -> Optional[int]:
+        """
+        How many of row i's generated tokens can no longer be cut: the
+        lines already checked, or everything before the cut. None when
+        all of them are final. With `final`, generation has ended.
+        """
+        row = self.rows[i]
+        if not self.active[i] or (row.cut is None and (final or row.reason)):
+            return None
+        return row.cut if row.cut is not None else row.line_start
+
+    def __call__(self, input_ids: torch.Tensor, scores, **kwargs) -> torch.Tensor:
+        done = [
+            (
+                self._advance(row, input_ids[i, self.prompt_len :].tolist())
+                if self.active[i]
+                else False
+            )
+            for i, row in enumerate(self.rows)
+        ]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+    def finish(self, stats: SectionStats = section_stats):
+        """Record how each active row ended (call once generate() returns)."""
+        for active, row in zip(self.active, self.rows):
+            if active:
+                saved = self.max_new_tokens - row.seen if row.reason else 0
+                stats.record(row.seen, saved, row.reason)
+
+    def _has_newline(self, token: int) -> bool:
+        if token not in self._newline:
+            self._newline[token] = "\n" in self.tokenizer.decode([token])
+        return self._newline[token]
+
+    def _advance(self, row: _RowState, generated: List[int]) -> bool:
+        if row.reason or row.ended:
+            return True
+        for j in range(row.seen, len(generated)):
+            if generated[j] in self.end_token_ids:
+                row.ended = True
+                return True
+            row.seen = j + 1
+            if self._has_newline(generated[j]):
+                text = self.tokenizer.decode(
+                    generated[row.line_start : j + 1], skip_special_tokens=True
+                )
+                start, row.line_start = row.line_start, j + 1
+                for line in text.split("\n"):
+                    if self._on_line(row, line, start):
+                        row.cut = start
+                        return True
+            if row.section < 0:
+                continue
+            budget = self.budgets.get(SECTION_NAMES[row.section], 0)
+            if budget and row.seen - row.section_start > budget:
+                row.reason = "budget"
+                return True
+        return False
+
+    def _on_line(self, row: _RowState, line: str, start: int) -> bool:
+        text = _heading_prefix.sub("", line.strip()).lower()
+        if not text:
+            return False
+        section = None
+        if len(text) <= 60:
+            section = next(
+                (k for k, p in enumerate(_section_patterns) if p.match(text)), None
+            )
+        last = len(SECTIONS) - 1
+        if section is not None and section > row.section:
+            row.section, row.section_start = section, start
+        elif row.section < 0:
+            # an untitled first line is the title
+            row.section, row.section_start = 0, start
+        elif (
+            row.section == last
+            and section is not None
+            and section < last
+            and _heading_marker.match(line.strip())
+        ):
+            row.reason = "repeat"
+        return row.reason is not None
@@ -0,0 +1,173 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+import torch
+
+# embed(texts) -> (N, D) L2-normalized embeddings
+Embedder = Callable[[List[str]], torch.Tensor]
+
+
+# plurals the suffix rules in `singular` get wrong, and words they must not touch
+_irregular = {
+    "leaves": "leaf",
+    "loaves": "loaf",
+    "halves": "half",
+    "cookies": "cookie",
+    "brownies": "brownie",
+}
+_invariant = {"molasses", "asparagus", "couscous", "hummus", "swiss", "grits"}
+
+
+def singular(ingredient: str) -> str:
+    """'cherry tomatoes' -> 'cherry tomato': singularize the last word."""
+    *head, word = ingredient.split(" ")
+    if word in _irregular:
+        word = _irregular[word]
+    elif word in _invariant or word.endswith(("ss", "us", "is")):
+        pass
+    elif word.endswith("ies") and len(word) > 4:
+        word = word[:-3] + "y"  # berries
+    elif word.endswith(("oes", "ches", "shes", "xes")):
+        word = word[:-2]  # tomatoes, peaches, radishes
+    elif word.endswith("s") and len(word) > 2:
+        word = word[:-1]  # onions, olives
+    return " ".join(head + [word])
+
+
+def request_scope(inputs: Dict[str, object]) -> str:
+    """
+    The request fields a cached recipe must match exactly: the ingredient
+    set (singular forms, so "onions" is "onion"), preferences, cuisine,
+    meal and cook time (see recipe_cache.normalize_inputs). Chicken vs
+    pork or vegan vs no nuts change the recipe however close their
+    embeddings are.
+    """
+    exact = {k: v for k, v in inputs.items() if k != "recipe_name"}
+    exact["ingredients"] = sorted({singular(i) for i in inputs["ingredients"]})
+    return json.dumps(exact, sort_keys=True)
+
+
+def request_text(inputs: Dict[str, object]) -> str:
+    """
+    What gets embedded for a recipe request: its free-text recipe name.
+    Unnamed requests all embed alike, so they match on the scope alone.
+    """
+    return str(inputs["recipe_name"]) or "any recipe"
+
+
+class _Entry(NamedTuple):
+    scope: str
+    text: str
+    recipe: str
+    embed: torch.Tensor
+
+
+class SemanticRecipeCache:
+    """
+    Past generations indexed by the embedding of their request. A request
+    whose cosine similarity to a stored one (in the same `scope`, e.g.
+    model + temperature + request_scope) is at least `threshold` is served
+    the stored recipe. Bounded LRU; when `path` is set the index is
+    loaded from and written back to a torch file.
+    """
+
+    def __init__(
+        self,
+        embed: Embedder,
+        embedder_name: str,
+        threshold: float = 0.95,
+        max_entries: int = 2000,
+        path: Optional[str] = None,
+    ):
+        self.embed = embed
+        self.embedder_name = embedder_name
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._hit_similarity = 0.0
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._ids = 0
+        self._matrix: Optional[Tuple[List[int], torch.Tensor]] = None
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load()
+
+    def lookup(self, scope: str, text: str) -> Tuple[Optional[str], torch.Tensor]:
+        """(stored recipe or None, embedding of `text` to pass on to `add`)."""
+        query = self.embed([text])[0]
+        with self._lock:
+            best_id, best = None, -1.0
+            if self._entries:
+                ids, matrix = self._stacked()
+                sims = (matrix @ query).tolist()
+                for entry_id, sim in zip(ids, sims):
+                    if sim > best and self._entries[entry_id].scope == scope:
+                        best_id, best = entry_id, sim
+            if best_id is not None and best >= self.threshold:
+                self._entries.move_to_end(best_id)
+                self.hits += 1
+                self._hit_similarity += best
+                return self._entries[best_id].recipe, query
+            self.misses += 1
+            return None, query
+
+    def add(self, scope: str, text: str, recipe: str, embed: torch.Tensor):
+        with self._lock:
+            self._entries[self._ids] = _Entry(scope, text, recipe, embed)
+            self._ids += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+            if self.path:
+                self._save()
+
+    def _stacked(self) -> Tuple[List[int], torch.Tensor]:
+        if self._matrix is None:
+            ids = list(self._entries)
+            embeds = torch.stack([self._entries[i].embed for i in ids])
+            self._matrix = (ids, embeds)
+        return self._matrix
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "mean_hit_similarity": (
+                self._hit_similarity / self.hits if self.hits else 0.0
+            ),
+            "threshold": self.threshold,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self.hits = self.misses = 0
+            self._hit_similarity = 0.0
+
+    def _load(self):
+        data = torch.load(self.path)
+        if data["embedder"] != self.embedder_name:
+            print(f"⚠️ {self.path} was built with {data['embedder']}; starting empty")
+            return
+        for scope, text, recipe, embed in data["entries"][-self.max_entries :]:
+            self._entries[self._ids] = _Entry(scope, text, recipe, embed)
+            self._ids += 1
+
+    def _save(self):
+        tmp = f"{self.path}.{os.getpid()}.tmp"  # processes must not share it
+        torch.save(
+            {
+                "embedder": self.embedder_name,
+                "entries": [tuple(e) for e in self._entries.values()],
+            },
+            tmp,
+        )
+        os.replace(tmp, self.path)
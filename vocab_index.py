@@ -0,0 +1,205 @@
+"""
+Embedding index over a large ingredient vocabulary for zero-shot detection.
+
+The vocabulary is a CSV of `category,label` rows (see ingredients.csv).
+Label embeddings are encoded once and persisted, so each image costs one
+vision-tower pass plus a single matrix multiply against the whole index.
+
+    python vocab_index.py ingredients.csv ingredients.index.pt   # (re)build
+"""
+
+import os
+import csv
+import hashlib
+import sys
+import torch
+from PIL import Image
+from typing import Dict, List, Optional, Tuple
+import detect
+from image_cache import dhash
+from lazy_model import LazyModel
+from metrics import detect_seconds
+
+vocab_path = os.getenv("INGREDIENT_VOCAB", "ingredients.csv")
+index_path = os.getenv("INGREDIENT_INDEX", "ingredients.index.pt")
+
+# Home tab: categories picked before ranking labels (0 = search all), and
+# the most labels a user can ask for per image
+top_categories = int(os.getenv("INGREDIENT_TOP_CATEGORIES", "3")) or None
+max_top_k = 20
+
+
+def read_vocabulary(path: str) -> List[Tuple[str, str]]:
+    with open(path, newline="") as f:
+        return [
+            (row["category"].strip(), row["label"].strip())
+            for row in csv.DictReader(f)
+            if row["label"].strip()
+        ]
+
+
+def _vocab_digest(rows: List[Tuple[str, str]]) -> str:
+    text = "\n".join(f"{c},{l}" for c, l in rows)
+    return hashlib.sha1(f"{detect.model_name}\n{text}".encode()).hexdigest()
+
+
+class IngredientIndex:
+    """Normalized label embeddings plus per-category centroids."""
+
+    def __init__(
+        self,
+        labels: List[str],
+        categories: List[str],
+        label_category: torch.Tensor,
+        embeds: torch.Tensor,
+        digest: str = "",
+    ):
+        self.labels = labels
+        self.categories = categories
+        self.label_category = label_category  # (N,) index into categories
+        self.embeds = embeds  # (N, D)
+        self.digest = digest
+        centroids = torch.stack(
+            [embeds[label_category == i].mean(dim=0) for i in range(len(categories))]
+        )
+        self.category_embeds = detect._normalize(centroids)  # (C, D)
+
+    @classmethod
+    def build(cls, rows: List[Tuple[str, str]]) -> "IngredientIndex":
+        categories = list(dict.fromkeys(c for c, _ in rows))
+        labels = [l for _, l in rows]
+        label_category = torch.tensor([categories.index(c) for c, _ in rows])
+        embeds = detect.encode_labels(labels)
+        return cls(labels, categories, label_category, embeds, _vocab_digest(rows))
+
+    def save(self, path: str):
+        torch.save(
+            {
+                "model_name": detect.model_name,
+                "digest": self.digest,
+                "labels": self.labels,
+                "categories": self.categories,
+                "label_category": self.label_category,
+                "embeds": self.embeds,
+            },
+            path,
+        )
+
+    @classmethod
+    def load_or_build(cls, vocab: str, path: Optional[str] = None) -> "IngredientIndex":
+        """Load the persisted index if it matches `vocab`, else rebuild it."""
+        rows = read_vocabulary(vocab)
+        if path and os.path.exists(path):
+            data = torch.load(path)
+            if data["digest"] == _vocab_digest(rows):
+                return cls(
+                    data["labels"],
+                    data["categories"],
+                    data["label_category"],
+                    data["embeds"],
+                    data["digest"],
+                )
+        index = cls.build(rows)
+        if path:
+            index.save(path)
+        return index
+
+    def search(
+        self,
+        image_embeds: torch.Tensor,
+        top_k: int = 5,
+        threshold: float = 0.01,
+        top_categories: Optional[int] = None,
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        Score each image embedding against the whole vocabulary. With
+        `top_categories`, first pick the best-matching categories and only
+        rank labels inside them.
+        """
+        model, _ = detect.clip.get()
+        with torch.inference_mode():
+            scale = model.logit_scale.exp()
+            logits = scale * image_embeds @ self.embeds.T  # (B, N)
+            if top_categories:
+                cat_logits = scale * image_embeds @ self.category_embeds.T
+                keep = cat_logits.topk(
+                    min(top_categories, len(self.categories)), dim=1
+                ).indices
+                allowed = (self.label_category[None, :, None] == keep[:, None, :]).any(
+                    -1
+                )
+                logits = logits.masked_fill(~allowed, float("-inf"))
+            probs = logits.softmax(dim=1)
+        k = min(top_k, len(self.labels))
+        return [detect._top_labels(row, self.labels, k, threshold) for row in probs]
+
+
+ingredient_index = LazyModel(
+    lambda: IngredientIndex.load_or_build(vocab_path, index_path),
+    name="ingredient-index",
+)
+
+
+def _result_key(
+    image: Image.Image,
+    index: IngredientIndex,
+    top_k: int,
+    threshold: float,
+    top_categories: Optional[int],
+) -> str:
+    return (
+        f"{detect.model_name}|{detect.vision_backend}|vocab|{dhash(image):016x}|"
+        f"{index.digest[:16]}|{top_k}|{threshold}|{top_categories}"
+    )
+
+
+@detect_seconds.time(mode="vocab")
+def detect_ingredients(
+    images: List[Image.Image],
+    top_k: int = 5,
+    threshold: float = 0.01,
+    top_categories: Optional[int] = None,
+    index: Optional[IngredientIndex] = None,
+) -> List[List[Tuple[str, float]]]:
+    """
+    Batched detection against the full ingredient vocabulary. Images
+    already in `detect.result_cache` are skipped.
+    """
+    index = index or ingredient_index.get()
+    keys = [_result_key(img, index, top_k, threshold, top_categories) for img in images]
+    results: List[Optional[List[Tuple[str, float]]]] = [
+        detect.result_cache.get(key) for key in keys
+    ]
+    # cache key -> input positions, so duplicates in one upload run once
+    pending: Dict[str, List[int]] = {}
+    for i, found in enumerate(results):
+        if found is None:
+            pending.setdefault(keys[i], []).append(i)
+    if not pending:
+        return results
+
+    _, processor = detect.clip.get()
+    todo = list(pending.items())
+    for start in range(0, len(todo), detect.max_batch_size):
+        chunk = todo[start : start + detect.max_batch_size]
+        pixel_values = processor(
+            images=[images[positions[0]] for _, positions in chunk],
+            return_tensors="pt",
+        )["pixel_values"]
+        image_embeds = detect.encode_images(pixel_values)
+        rows = index.search(image_embeds, top_k, threshold, top_categories)
+        for (key, positions), found in zip(chunk, rows):
+            detect.result_cache.put(key, found)
+            for i in positions:
+                results[i] = list(found)
+    return results
+
+
+if __name__ == "__main__":
+    src = sys.argv[1] if len(sys.argv) > 1 else vocab_path
+    dst = sys.argv[2] if len(sys.argv) > 2 else index_path
+    index = IngredientIndex.build(read_vocabulary(src))
+    index.save(dst)
+    print(
+        f"Indexed {len(index.labels)} labels in {len(index.categories)} categories -> {dst}"
+    )
@@ -0,0 +1,238 @@
+"""
+Process-pool serving mode for recipe generation.
+
+Each worker process is pinned to its own set of cores, runs torch with
+that many threads and loads the recipe model with memory-mapped weights
+(RECIPE_CPU_PRECISION=mmap), so all workers share one copy of the weights
+in the page cache. Calls go to the worker with the fewest requests in
+flight; inside a worker they still go through its batching worker.
+
+    workers = WorkerPool(num_workers=4)
+    recipe = workers.generate_recipe(ingredients_list="tomato, onion", ...)
+    workers.close()
+
+Only whole results come back; streaming stays in-process.
+"""
+
+import os
+import itertools
+import multiprocessing as mp
+import pickle
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+# recipe_gen functions a worker will run
+worker_methods = ("generate_recipe", "generate_recipe_options", "generate_text")
+
+
+def core_sets(num_workers: int, cores: Optional[List[int]] = None) -> List[List[int]]:
+    """Split the usable cores into `num_workers` contiguous, disjoint sets."""
+    cores = sorted(cores if cores is not None else os.sched_getaffinity(0))
+    if num_workers > len(cores):
+        raise ValueError(f"{num_workers} workers but only {len(cores)} cores")
+    size, extra = divmod(len(cores), num_workers)
+    sets, start = [], 0
+    for i in range(num_workers):
+        end = start + size + (1 if i < extra else 0)
+        sets.append(cores[start:end])
+        start = end
+    return sets
+
+
+def _worker_main(index: int, cores: List[int], env: Dict[str, str], tasks, results):
+    # before torch is imported, so its thread pools see the settings
+    os.environ.update(env)
+    os.environ["OMP_NUM_THREADS"] = str(len(cores))
+    os.sched_setaffinity(0, cores)
+    import torch
+    import recipe_gen
+
+    torch.set_num_threads(len(cores))
+    try:
+        recipe_gen.generator.get()
+    except Exception as exc:
+        results.put((index, None, "failed", f"{type(exc).__name__}: {exc}"))
+        return
+    results.put((index, None, "ready", None))
+
+    def run(task_id: int, method: str, kwargs: Dict):
+        try:
+            value = getattr(recipe_gen, method)(**kwargs)
+            results.put((index, task_id, "ok", value))
+        except Exception as exc:
+            # re-raised as its own type (e.g. Overloaded) if it pickles
+            try:
+                pickle.dumps(exc)
+            except Exception:
+                exc = RuntimeError(f"{type(exc).__name__}: {exc}")
+            results.put((index, task_id, "error", exc))
+
+    # several requests in flight per worker so its batcher can merge them
+    executor = ThreadPoolExecutor(
+        max_workers=int(env.get("RECIPE_MAX_BATCH_SIZE", "4"))
+    )
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        executor.submit(run, *task)
+    executor.shutdown(wait=True)
+
+
+class WorkerPool:
+    """
+    `num_workers` generation processes (default: one per 8 cores) with a
+    least-loaded dispatcher. `env` is applied in each worker before
+    recipe_gen is imported, e.g. to pick the model or precision. Workers
+    run without the semantic cache, and never persist its index if `env`
+    turns it on: each would overwrite the others'. A worker that exits
+    fails the requests it was given; worker errors are re-raised with
+    their own exception type.
+    """
+
+    def __init__(
+        self,
+        num_workers: Optional[int] = None,
+        cores: Optional[List[int]] = None,
+        env: Optional[Dict[str, str]] = None,
+    ):
+        available = cores if cores is not None else sorted(os.sched_getaffinity(0))
+        num_workers = num_workers or max(1, len(available) // 8)
+        self.cores = core_sets(num_workers, available)
+        self.env = {
+            "RECIPE_CPU_PRECISION": "mmap",
+            "RECIPE_SEMANTIC_CACHE": "0",
+            **(env or {}),
+            "RECIPE_SEMANTIC_INDEX": "",
+        }
+        self.in_flight = [0] * num_workers
+        self.completed = [0] * num_workers
+        self.ready = [threading.Event() for _ in range(num_workers)]
+        self.failed: Dict[int, str] = {}  # worker -> why it stopped
+        self._futures: Dict[int, Tuple[int, Future]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._closing = False
+
+        ctx = mp.get_context("spawn")  # never fork a process with torch threads
+        self._results = ctx.Queue()
+        self._tasks = [ctx.Queue() for _ in range(num_workers)]
+        self._procs = [
+            ctx.Process(
+                target=_worker_main,
+                args=(i, cores_i, self.env, self._tasks[i], self._results),
+                name=f"recipe-worker-{i}",
+                daemon=True,
+            )
+            for i, cores_i in enumerate(self.cores)
+        ]
+        for proc in self._procs:
+            proc.start()
+        self._reader = threading.Thread(
+            target=self._read_results, name="worker-pool-results", daemon=True
+        )
+        self._reader.start()
+
+    def submit(self, method: str, **kwargs) -> Future:
+        """Run recipe_gen.<method>(**kwargs) on the least-loaded worker."""
+        if method not in worker_methods:
+            raise ValueError(f"{method!r} cannot run on a worker")
+        future: Future = Future()
+        with self._lock:
+            worker = min(range(len(self._procs)), key=self.in_flight.__getitem__)
+            if self.in_flight[worker] == float("inf"):
+                raise RuntimeError("No recipe worker is running")
+            task_id = next(self._ids)
+            self.in_flight[worker] += 1
+            self._futures[task_id] = (worker, future)
+        self._tasks[worker].put((task_id, method, kwargs))
+        return future
+
+    def generate_recipe(self, **kwargs) -> str:
+        return self.submit("generate_recipe", **kwargs).result()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """True once every worker has started; False on timeout or if one failed."""
+        started = all(event.wait(timeout) for event in self.ready)
+        with self._lock:
+            return started and not self.failed
+
+    def _read_results(self, poll: float = 1.0):
+        exited = set()
+        while len(exited) < len(self._procs):
+            try:
+                self._on_result(*self._results.get(timeout=poll))
+            except queue.Empty:
+                pass
+            for worker, proc in enumerate(self._procs):
+                if worker in exited or proc.is_alive():
+                    continue
+                exited.add(worker)
+                self._drain()  # results it sent before exiting
+                reason = f"Recipe worker {worker} exited (code {proc.exitcode})"
+                if not self._closing:
+                    print(f"⚠️ {reason}")
+                self._fail_worker(worker, reason)
+
+    def _drain(self):
+        while True:
+            try:
+                self._on_result(*self._results.get_nowait())
+            except queue.Empty:
+                return
+
+    def _on_result(self, worker: int, task_id: Optional[int], status: str, value):
+        if task_id is None:
+            if status == "ready":
+                self.ready[worker].set()
+            else:
+                print(f"⚠️ Recipe worker {worker} failed to start ({value})")
+                self._fail_worker(worker, value)
+            return
+        with self._lock:
+            if task_id not in self._futures:
+                return  # already failed with its worker
+            self.in_flight[worker] -= 1
+            self.completed[worker] += 1
+            _, future = self._futures.pop(task_id)
+        if status == "ok":
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+
+    def _fail_worker(self, worker: int, reason: str):
+        # keep the dispatcher away from it and fail what it was given
+        with self._lock:
+            self.failed.setdefault(worker, reason)
+            self.in_flight[worker] = float("inf")
+            queued = [t for t, (w, _) in self._futures.items() if w == worker]
+            futures = [self._futures.pop(t)[1] for t in queued]
+        for future in futures:
+            future.set_exception(RuntimeError(reason))
+        self.ready[worker].set()
+
+    def stats(self) -> List[Dict[str, object]]:
+        with self._lock:
+            return [
+                {
+                    "worker": i,
+                    "pid": proc.pid,
+                    "cores": self.cores[i],
+                    "ready": self.ready[i].is_set(),
+                    "failed": self.failed.get(i),
+                    "in_flight": self.in_flight[i],
+                    "completed": self.completed[i],
+                }
+                for i, proc in enumerate(self._procs)
+            ]
+
+    def close(self, timeout: float = 30.0):
+        self._closing = True
+        for tasks in self._tasks:
+            tasks.put(None)
+        for proc in self._procs:
+            proc.join(timeout)
+            if proc.is_alive():
+                proc.terminate()